@@ -0,0 +1,298 @@
+import json
+from typing import AsyncIterator, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.config import settings
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful study assistant."
+
+# Shared clients, created lazily on first use and closed on app shutdown
+_http_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[AsyncOpenAI] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the pooled HTTP client shared by all AI providers"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.ai_request_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.ai_max_connections,
+                max_keepalive_connections=settings.ai_max_keepalive_connections
+            )
+        )
+    return _http_client
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the async OpenAI client, reusing the shared connection pool"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            http_client=get_http_client(),
+            timeout=settings.ai_request_timeout
+        )
+    return _openai_client
+
+async def close_ai_clients():
+    """Close the shared clients (called on application shutdown)"""
+    global _http_client, _openai_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _openai_client = None
+
+class AIProviderError(Exception):
+    """Raised when a provider returns an error or an unusable response"""
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield the data payloads of a Server-Sent Events response"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        if data:
+            yield data
+
+async def _raise_for_stream_status(response: httpx.Response, label: str):
+    if response.status_code != 200:
+        body = (await response.aread()).decode("utf-8", errors="replace")
+        raise AIProviderError(f"{label} API error: {response.status_code} - {body}")
+
+HISTORY_SPEAKERS = {"user": "Student", "assistant": "Assistant"}
+
+def render_history(history: List[dict]) -> str:
+    """Earlier turns as plain text, for providers that take a single prompt"""
+    return "\n".join(
+        f"{HISTORY_SPEAKERS[turn['role']]}: {turn['content']}" if turn["role"] in HISTORY_SPEAKERS else turn["content"]
+        for turn in history
+    )
+
+class AIProvider:
+    """Common interface for the chat completion backends"""
+    name = "base"
+    label = "AI provider"
+
+    @property
+    def model(self) -> str:
+        raise NotImplementedError
+
+    def is_configured(self) -> bool:
+        raise NotImplementedError
+
+    async def complete(self, message: str, context: dict = None, system_prompt: str = None,
+                       history: List[dict] = None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, message: str, context: dict = None, system_prompt: str = None,
+                     history: List[dict] = None) -> AsyncIterator[str]:
+        """Yield the answer in chunks; providers without streaming send it whole"""
+        yield await self.complete(message, context, system_prompt, history)
+
+class GeminiProvider(AIProvider):
+    """Google Gemini via the generateContent REST endpoint"""
+    name = "gemini"
+    label = "Gemini"
+
+    @property
+    def model(self) -> str:
+        return settings.gemini_model
+
+    def is_configured(self) -> bool:
+        return bool(settings.gemini_api)
+
+    def build_payload(self, message: str, context: dict = None, system_prompt: str = None,
+                      history: List[dict] = None) -> dict:
+        context_text = f"Context: {json.dumps(context)}\n\n" if context else ""
+        history_text = f"Conversation so far:\n{render_history(history)}\n\n" if history else ""
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": f"{system_prompt or DEFAULT_SYSTEM_PROMPT}\n\n"
+                                    f"{context_text}"
+                                    f"{history_text}"
+                                    f"User question: {message}"
+                        }
+                    ]
+                }
+            ],
+            "generationConfig": {
+                "temperature": 0.7,
+                "maxOutputTokens": 150
+            }
+        }
+
+    async def complete(self, message: str, context: dict = None, system_prompt: str = None,
+                       history: List[dict] = None) -> str:
+        if not self.is_configured():
+            raise AIProviderError("Gemini API key not configured")
+
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.gemini_model}:generateContent"
+        response = await get_http_client().post(
+            url,
+            params={"key": settings.gemini_api},
+            json=self.build_payload(message, context, system_prompt, history),
+            headers={"Content-Type": "application/json"}
+        )
+
+        if response.status_code != 200:
+            raise AIProviderError(f"Gemini API error: {response.status_code} - {response.text}")
+
+        data = response.json()
+        if data.get("candidates"):
+            parts = data["candidates"][0].get("content", {}).get("parts", [])
+            if parts and "text" in parts[0]:
+                return parts[0]["text"].strip()
+
+        raise AIProviderError("Unexpected response format from Gemini")
+
+    async def stream(self, message: str, context: dict = None, system_prompt: str = None,
+                     history: List[dict] = None) -> AsyncIterator[str]:
+        if not self.is_configured():
+            raise AIProviderError("Gemini API key not configured")
+
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.gemini_model}:streamGenerateContent"
+        async with get_http_client().stream(
+            "POST",
+            url,
+            params={"key": settings.gemini_api, "alt": "sse"},
+            json=self.build_payload(message, context, system_prompt, history),
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            await _raise_for_stream_status(response, "Gemini")
+            async for data in iter_sse_data(response):
+                candidates = json.loads(data).get("candidates") or [{}]
+                for part in candidates[0].get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+
+class OpenAIProvider(AIProvider):
+    """OpenAI chat completions through the async SDK client"""
+    name = "openai"
+    label = "OpenAI"
+
+    @property
+    def model(self) -> str:
+        return settings.openai_model
+
+    def is_configured(self) -> bool:
+        return bool(settings.openai_api_key)
+
+    def build_messages(self, message: str, context: dict = None, system_prompt: str = None,
+                       history: List[dict] = None) -> List[dict]:
+        messages = [
+            {"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT},
+            *(history or []),
+            {"role": "user", "content": message}
+        ]
+        if context:
+            messages.insert(1, {"role": "system", "content": f"Context: {json.dumps(context)}"})
+        return messages
+
+    async def complete(self, message: str, context: dict = None, system_prompt: str = None,
+                       history: List[dict] = None) -> str:
+        if not self.is_configured():
+            raise AIProviderError("OpenAI API key not configured")
+
+        response = await get_openai_client().chat.completions.create(
+            model=settings.openai_model,
+            messages=self.build_messages(message, context, system_prompt, history),
+            max_tokens=150,
+            temperature=0.7
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    async def stream(self, message: str, context: dict = None, system_prompt: str = None,
+                     history: List[dict] = None) -> AsyncIterator[str]:
+        if not self.is_configured():
+            raise AIProviderError("OpenAI API key not configured")
+
+        chunks = await get_openai_client().chat.completions.create(
+            model=settings.openai_model,
+            messages=self.build_messages(message, context, system_prompt, history),
+            max_tokens=150,
+            temperature=0.7,
+            stream=True
+        )
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class GitHubAIProvider(AIProvider):
+    """GitHub Models inference endpoint (OpenAI-compatible)"""
+    name = "github"
+    label = "GitHub AI"
+
+    @property
+    def model(self) -> str:
+        return settings.github_model
+
+    def is_configured(self) -> bool:
+        return bool(settings.github_token)
+
+    def build_payload(self, message: str, context: dict = None, system_prompt: str = None,
+                      history: List[dict] = None) -> dict:
+        return {
+            "model": settings.github_model,
+            "messages": [
+                {"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT},
+                *(history or []),
+                {"role": "user", "content": message}
+            ],
+            "max_tokens": 150,
+            "temperature": 0.7
+        }
+
+    async def complete(self, message: str, context: dict = None, system_prompt: str = None,
+                       history: List[dict] = None) -> str:
+        if not self.is_configured():
+            raise AIProviderError("GitHub token not configured")
+
+        response = await get_http_client().post(
+            settings.github_endpoint,
+            json=self.build_payload(message, context, system_prompt, history),
+            headers={
+                "Authorization": f"Bearer {settings.github_token}",
+                "Content-Type": "application/json"
+            }
+        )
+
+        if response.status_code != 200:
+            raise AIProviderError(f"GitHub AI API error: {response.status_code} - {response.text}")
+
+        data = response.json()
+        return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+
+    async def stream(self, message: str, context: dict = None, system_prompt: str = None,
+                     history: List[dict] = None) -> AsyncIterator[str]:
+        if not self.is_configured():
+            raise AIProviderError("GitHub token not configured")
+
+        async with get_http_client().stream(
+            "POST",
+            settings.github_endpoint,
+            json={**self.build_payload(message, context, system_prompt, history), "stream": True},
+            headers={
+                "Authorization": f"Bearer {settings.github_token}",
+                "Content-Type": "application/json"
+            }
+        ) as response:
+            await _raise_for_stream_status(response, "GitHub AI")
+            async for data in iter_sse_data(response):
+                choices = json.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+# Fallback order: Gemini is the primary service, then OpenAI, then GitHub AI
+PROVIDERS: List[AIProvider] = [GeminiProvider(), OpenAIProvider(), GitHubAIProvider()]
+
+def get_providers() -> List[AIProvider]:
+    """Return the configured providers in fallback order"""
+    return [provider for provider in PROVIDERS if provider.is_configured()]
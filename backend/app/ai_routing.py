@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from app.ai_providers import AIProvider
+from app.circuit_breaker import get_breaker, order_by_health
+from app.config import settings
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's breaker rejects the call without trying it"""
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per provider"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, provider_name: str, seconds: float):
+        samples = self._samples.setdefault(provider_name, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def percentile(self, provider_name: str, fraction: float) -> Optional[float]:
+        samples = self._samples.get(provider_name)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[index]
+
+    def hedge_delay(self, provider_name: str) -> float:
+        """How long to wait on a provider before firing a hedge request"""
+        samples = self._samples.get(provider_name)
+        if not samples or len(samples) < settings.ai_hedge_min_samples:
+            return settings.ai_hedge_default_delay
+        delay = self.percentile(provider_name, settings.ai_hedge_percentile)
+        return max(settings.ai_hedge_min_delay, delay)
+
+latency_tracker = LatencyTracker(settings.ai_latency_window)
+
+async def _call_provider(provider: AIProvider, budget: float, message: str, context: dict,
+                         system_prompt: str, history: List[dict] = None) -> str:
+    """Run one provider call within its share of the request deadline"""
+    breaker = get_breaker(provider.name)
+    if not breaker.try_acquire():
+        metrics.ai_calls.inc(provider.name, "circuit_open")
+        raise CircuitOpenError(f"circuit {breaker.state}")
+
+    started = time.monotonic()
+    try:
+        response = await asyncio.wait_for(
+            provider.complete(message, context, system_prompt, history),
+            timeout=min(settings.ai_request_timeout, budget)
+        )
+        if not response:
+            raise ValueError("Empty response")
+    except asyncio.CancelledError:
+        # Lost a hedged race: not the provider's fault
+        breaker.release()
+        metrics.ai_calls.inc(provider.name, "cancelled")
+        raise
+    except Exception as e:
+        breaker.record_failure(time.monotonic() - started)
+        metrics.ai_calls.inc(provider.name, "timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+        raise
+
+    latency = time.monotonic() - started
+    breaker.record_success(latency)
+    latency_tracker.record(provider.name, latency)
+    metrics.ai_calls.inc(provider.name, "success")
+    metrics.ai_latency.observe(latency, provider.name, "complete")
+    return response
+
+async def run_sequential(providers: List[AIProvider], message: str, context: dict = None,
+                         system_prompt: str = None, history: List[dict] = None) -> Optional[str]:
+    """Try providers one after another until one answers or the deadline passes.
+
+    Each provider gets an equal share of what is left of the request deadline,
+    so a hanging primary cannot starve the fallbacks.
+    """
+    deadline = time.monotonic() + settings.ai_request_deadline
+    for index, provider in enumerate(providers):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning("AI request deadline exceeded, skipping remaining providers")
+            break
+        budget = remaining / (len(providers) - index)
+        try:
+            response = await _call_provider(provider, budget, message, context, system_prompt, history)
+            if index > 0:
+                metrics.ai_failovers.inc(provider.name)
+            return response
+        except CircuitOpenError:
+            logger.info("%s skipped: circuit open", provider.label)
+        except asyncio.TimeoutError:
+            logger.warning("%s timed out, trying next provider", provider.label)
+        except Exception as e:
+            logger.warning("%s failed: %s, trying next provider", provider.label, e)
+    return None
+
+async def run_hedged(providers: List[AIProvider], message: str, context: dict = None,
+                     system_prompt: str = None, history: List[dict] = None) -> Optional[str]:
+    """Race providers: start the primary, hedge to the next one when it is slow or fails.
+
+    The next provider is launched when the most recently started one has not
+    answered within its p95 latency, or as soon as any in-flight call fails.
+    The first good answer wins and the remaining calls are cancelled.
+    """
+    deadline = time.monotonic() + settings.ai_request_deadline
+    queue = list(providers)
+    in_flight: Dict[asyncio.Task, AIProvider] = {}
+    last_started: Optional[AIProvider] = None
+
+    def launch_next():
+        nonlocal last_started
+        provider = queue.pop(0)
+        remaining = deadline - time.monotonic()
+        task = asyncio.create_task(_call_provider(provider, remaining, message, context, system_prompt, history))
+        in_flight[task] = provider
+        last_started = provider
+
+    try:
+        while queue or in_flight:
+            if not in_flight:
+                launch_next()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("AI request deadline exceeded, cancelling in-flight providers")
+                return None
+
+            wait_for = remaining
+            if queue:
+                wait_for = min(wait_for, latency_tracker.hedge_delay(last_started.name))
+
+            done, _ = await asyncio.wait(
+                set(in_flight), timeout=wait_for, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            failed = False
+            for task in done:
+                provider = in_flight.pop(task)
+                try:
+                    response = task.result()
+                    if provider is not providers[0]:
+                        metrics.ai_failovers.inc(provider.name)
+                    return response
+                except CircuitOpenError:
+                    logger.info("%s skipped: circuit open", provider.label)
+                except asyncio.TimeoutError:
+                    logger.warning("%s timed out", provider.label)
+                except Exception as e:
+                    logger.warning("%s failed: %s", provider.label, e)
+                failed = True
+
+            # Either the current provider is slower than its p95 or one failed:
+            # bring in the next provider without abandoning those still running
+            if queue and (failed or not done):
+                launch_next()
+        return None
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+async def dispatch(providers: List[AIProvider], message: str, context: dict = None,
+                   system_prompt: str = None, history: List[dict] = None) -> Optional[str]:
+    """Get a response using the configured dispatch mode (sequential or hedged).
+
+    Providers with an open circuit are skipped outright and the rest are
+    ordered by live health, so a failing primary costs nothing per request.
+    """
+    providers = order_by_health(providers)
+    if settings.ai_dispatch_mode == "hedged":
+        return await run_hedged(providers, message, context, system_prompt, history)
+    return await run_sequential(providers, message, context, system_prompt, history)
+
+async def stream_dispatch(providers: List[AIProvider], message: str, context: dict = None,
+                          system_prompt: str = None, history: List[dict] = None) -> AsyncIterator[str]:
+    """Stream tokens from the healthiest available provider.
+
+    Fails over to the next provider only while nothing has been sent yet;
+    once tokens are flowing an error is raised to the caller instead.
+    Yields nothing if every provider fails.
+    """
+    for index, provider in enumerate(order_by_health(providers)):
+        breaker = get_breaker(provider.name)
+        if not breaker.try_acquire():
+            metrics.ai_calls.inc(provider.name, "circuit_open")
+            continue
+
+        started = time.monotonic()
+        emitted = False
+        stream = provider.stream(message, context, system_prompt, history)
+        try:
+            async for token in stream:
+                emitted = True
+                yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release()
+            metrics.ai_calls.inc(provider.name, "cancelled")
+            raise
+        except Exception as e:
+            breaker.record_failure(time.monotonic() - started)
+            metrics.ai_calls.inc(provider.name, "error")
+            if emitted:
+                raise
+            logger.warning("%s stream failed: %s, trying next provider", provider.label, e)
+            continue
+        finally:
+            await stream.aclose()
+
+        latency = time.monotonic() - started
+        if emitted:
+            breaker.record_success(latency)
+            metrics.ai_calls.inc(provider.name, "success")
+            metrics.ai_latency.observe(latency, provider.name, "stream")
+            if index > 0:
+                metrics.ai_failovers.inc(provider.name)
+            return
+        breaker.record_failure(latency)
+        metrics.ai_calls.inc(provider.name, "error")
+        logger.warning("%s returned an empty stream, trying next provider", provider.label)
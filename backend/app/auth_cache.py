@@ -0,0 +1,101 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from jose import jwt
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.lru_cache import LRUCache
+from app.models import User
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Snapshot of the authenticated user handed to the route handlers"""
+    id: int
+    email: str
+    username: Optional[str]
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user) -> "UserPrincipal":
+        """From a User or any row with id, email, username and is_active"""
+        return cls(id=user.id, email=user.email, username=user.username, is_active=user.is_active)
+
+class AuthCache:
+    """Bounded TTL caches for decoded tokens and resolved users.
+
+    tokens:     raw JWT -> subject (email); never outlives the token's exp
+    principals: email -> UserPrincipal; dropped when this process changes
+                the User row through the ORM (unit of work or bulk
+                update()/delete() on User)
+
+    The caches are per process: a change made by another worker, or with
+    raw SQL, is only seen once the entry expires after
+    `auth_cache_ttl_seconds`.
+    """
+
+    def __init__(self):
+        self.tokens = LRUCache(settings.auth_cache_max_entries, settings.auth_cache_ttl_seconds)
+        self.principals = LRUCache(settings.auth_cache_max_entries, settings.auth_cache_ttl_seconds)
+
+    def decode_subject(self, token: str) -> Optional[str]:
+        """Return the token's subject, decoding (and verifying) it only on a miss.
+
+        Raises JWTError for invalid or expired tokens.
+        """
+        email = self.tokens.get(token)
+        if email is not None:
+            return email
+
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        email = payload.get("sub")
+        if email is None:
+            return None
+        expires_at = time.time() + settings.auth_cache_ttl_seconds
+        if payload.get("exp"):
+            expires_at = min(expires_at, float(payload["exp"]))
+        self.tokens.set(token, email, expires_at)
+        return email
+
+    def get_principal(self, email: str) -> Optional[UserPrincipal]:
+        return self.principals.get(email)
+
+    def set_principal(self, user) -> UserPrincipal:
+        principal = UserPrincipal.from_user(user)
+        self.principals.set(user.email, principal)
+        return principal
+
+    def invalidate_user(self, email: str):
+        self.principals.pop(email)
+
+    def invalidate_all_users(self):
+        self.principals.clear()
+
+    def stats(self) -> dict:
+        return {
+            "token_hits": self.tokens.hits,
+            "token_misses": self.tokens.misses,
+            "principal_hits": self.principals.hits,
+            "principal_misses": self.principals.misses
+        }
+
+auth_cache = AuthCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    # Deactivation, profile edits and email changes flushed from a loaded User
+    auth_cache.invalidate_user(target.email)
+    history = inspect(target).attrs.email.history
+    for old_email in history.deleted or ():
+        auth_cache.invalidate_user(old_email)
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_bulk_changed_users(orm_execute_state):
+    # update(User) / delete(User) skip the mapper events and may touch any row
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+        mapper.class_ is User for mapper in orm_execute_state.all_mappers
+    ):
+        auth_cache.invalidate_all_users()
@@ -0,0 +1,173 @@
+"""Conversation-aware prompts with a bounded token budget.
+
+Each chat request is sent with the user's recent turns, pulled from
+chat_messages newest first through the (user_id, timestamp) index, and packed
+into a per-model token budget: system prompt, the (trimmed) request context
+and the message itself come first, then as many recent turns as fit.
+
+Turns older than the recent window are folded into a short summary of what
+the student asked before. The summary is cached per user together with the
+position of the newest message it covers, so each request only digests the
+few messages that have aged out since the last one instead of re-reading
+the whole conversation. Tokens are estimated locally (characters per token).
+
+A prompt carrying history is specific to one conversation, so its answer is
+neither cached nor shared with concurrent identical requests (see
+app.routers.ai_chat.shares_answers); only history-free prompts are. Requests
+choose whether history is sent (AIChatRequest.history), and the canned
+follow-up suggestions are answered without it by default.
+"""
+import json
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import pagination
+from app.config import settings
+from app.lru_cache import LRUCache
+from app.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing (role, separators) on top of the text itself
+MESSAGE_OVERHEAD_TOKENS = 4
+# Digests kept in a user's summary before the oldest are dropped
+MAX_DIGESTS = 20
+DIGEST_WORDS = 16
+
+@dataclass
+class ConversationPrompt:
+    message: str
+    context: Optional[dict]
+    history: List[dict]  # [{"role": "system" | "user" | "assistant", "content": ...}], oldest first
+    estimated_tokens: int
+
+@dataclass
+class SummaryState:
+    upto: Tuple[datetime, int]  # (timestamp, id) of the newest message folded in
+    digests: List[str] = field(default_factory=list)
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / settings.ai_context_chars_per_token) + MESSAGE_OVERHEAD_TOKENS
+
+def trim_context(context: Optional[dict], max_tokens: int) -> Optional[dict]:
+    """Keep the context's top-level entries, in order, while they fit in max_tokens"""
+    if not context:
+        return context
+    kept = {}
+    used = 0
+    for key, value in context.items():
+        cost = estimate_tokens(json.dumps({key: value}, default=str))
+        if used + cost > max_tokens:
+            logger.debug("Dropping context key %r to stay within %d tokens", key, max_tokens)
+            continue
+        kept[key] = value
+        used += cost
+    return kept or None
+
+def digest(content: str) -> str:
+    """First sentence of a message, capped at DIGEST_WORDS words"""
+    sentence = re.split(r"(?<=[.!?])\s", content.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    return " ".join(words[:DIGEST_WORDS]) + ("..." if len(words) > DIGEST_WORDS else "")
+
+def token_budget(models: Iterable[str]) -> int:
+    """The smallest budget among the models that may receive the prompt"""
+    budgets = [settings.ai_context_model_budgets.get(model, settings.ai_context_token_budget) for model in models]
+    return min(budgets, default=settings.ai_context_token_budget)
+
+class ConversationContext:
+    """Builds budgeted prompts and keeps the per-user summary cache"""
+
+    def __init__(self):
+        self.summaries = LRUCache(settings.ai_context_cache_max_entries, settings.ai_context_cache_ttl_seconds)
+        self.stats = {"built": 0, "summary_messages_digested": 0, "turns_dropped": 0}
+
+    async def _summary(self, db: AsyncSession, user_id: int, window_start: Tuple[datetime, int],
+                       visible: Sequence = ()) -> str:
+        """Summary of the user's questions older than the recent window, updated incrementally"""
+        state: Optional[SummaryState] = self.summaries.get(user_id)
+        conditions = [ChatMessage.user_id == user_id, ChatMessage.role == "user", pagination.before(ChatMessage.timestamp, ChatMessage.id, window_start), *visible]
+        if state is not None:
+            conditions.append(pagination.after(ChatMessage.timestamp, ChatMessage.id, state.upto))
+
+        result = await db.execute(
+            select(ChatMessage.id, ChatMessage.timestamp, ChatMessage.content)
+            .where(*conditions)
+            .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+            .limit(MAX_DIGESTS)
+        )
+        aged_out = list(reversed(result.all()))
+        if aged_out:
+            digests = (state.digests if state else []) + [digest(row.content) for row in aged_out]
+            state = SummaryState(upto=(aged_out[-1].timestamp, aged_out[-1].id), digests=digests[-MAX_DIGESTS:])
+            self.summaries.set(user_id, state)
+            self.stats["summary_messages_digested"] += len(aged_out)
+        if state is None or not state.digests:
+            return ""
+
+        # Drop the oldest digests until the summary fits its budget
+        digests = list(state.digests)
+        while digests:
+            summary = "Earlier in this conversation the student asked about: " + "; ".join(digests)
+            if estimate_tokens(summary) <= settings.ai_context_summary_tokens:
+                return summary
+            digests.pop(0)
+        return ""
+
+    async def build(self, db: AsyncSession, user_id: int, message: str, context: Optional[dict],
+                    system_prompt: str, models: Iterable[str], visible: Sequence = (),
+                    with_history: bool = True) -> ConversationPrompt:
+        """`visible`: extra conditions on the user's messages (e.g. hiding a history being cleared)"""
+        context = trim_context(context, settings.ai_context_max_context_tokens)
+        used = estimate_tokens(system_prompt) + estimate_tokens(message)
+        if context:
+            used += estimate_tokens(json.dumps(context, default=str))
+        if not settings.ai_context_enabled or not with_history:
+            return ConversationPrompt(message, context, [], used)
+
+        result = await db.execute(
+            select(ChatMessage.id, ChatMessage.timestamp, ChatMessage.role, ChatMessage.content)
+            .where(ChatMessage.user_id == user_id, *visible)
+            .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+            .limit(settings.ai_context_max_turns)
+        )
+        recent = result.all()  # newest first
+
+        summary = ""
+        if len(recent) == settings.ai_context_max_turns:
+            summary = await self._summary(db, user_id, (recent[-1].timestamp, recent[-1].id), visible)
+
+        remaining = token_budget(models) - used
+        summary_cost = estimate_tokens(summary) if summary else 0
+        if summary_cost > remaining:
+            summary, summary_cost = "", 0
+        remaining -= summary_cost
+
+        # Newest turns first, stopping at the first one that no longer fits
+        turns = []
+        for row in recent:
+            cost = estimate_tokens(row.content)
+            if cost > remaining:
+                self.stats["turns_dropped"] += len(recent) - len(turns)
+                break
+            turns.append({"role": row.role, "content": row.content})
+            remaining -= cost
+        turns.reverse()
+
+        history = ([{"role": "system", "content": summary}] if summary else []) + turns
+        self.stats["built"] += 1
+        return ConversationPrompt(message, context, history, used + summary_cost + sum(
+            estimate_tokens(turn["content"]) for turn in turns
+        ))
+
+    def invalidate_user(self, user_id: int):
+        self.summaries.pop(user_id)
+
+conversation_context = ConversationContext()
@@ -0,0 +1,259 @@
+"""Retention, archival and compaction for chat_messages.
+
+A background job keeps the table bounded: every user keeps at most
+`chat_retention_max_messages_per_user` messages, and messages older than
+`chat_retention_max_age_days` are dropped. Deletes run in chunks of
+`chat_retention_chunk_size` rows, each in its own short transaction with a
+pause in between, so the API's writers are never locked out for a whole
+table scan. Pruned turns can be archived to gzip'd NDJSON first, and freed
+pages are handed back to the filesystem with `PRAGMA incremental_vacuum`.
+
+Clearing a user's history goes through the same job: the request stores the
+user's newest message id as a fence in chat_history_clears, readers only see
+messages above it (`visible`), and the chunked delete runs in the background.
+Fences live in the database, so every worker hides the same messages and
+clears interrupted by a restart are resumed when the job starts again.
+Conversation summaries cached by other workers still quote cleared turns
+until they expire (`ai_context_cache_ttl_seconds`).
+
+    python -m app.chat_retention run
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import pagination
+from app.chat_context import conversation_context
+from app.config import settings
+from app.database import IS_SQLITE, AsyncSessionLocal, async_engine
+from app.models import ChatHistoryClear, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = (ChatMessage.id, ChatMessage.user_id, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp)
+
+def archive_path(directory: str) -> str:
+    return os.path.join(directory, f"chat_messages-{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson.gz")
+
+def write_archive(path: str, rows) -> None:
+    """Append rows as NDJSON; each call adds a gzip member, which readers concatenate"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as archive:
+        for row in rows:
+            archive.write(json.dumps({
+                "id": row.id,
+                "user_id": row.user_id,
+                "role": row.role,
+                "content": row.content,
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None
+            }) + "\n")
+
+async def delete_chunked(conditions: list, archive: Optional[str] = None) -> Set[int]:
+    """Delete matching messages oldest id first, one chunk per transaction; returns the users touched"""
+    columns = ARCHIVE_COLUMNS if archive else (ChatMessage.id, ChatMessage.user_id)
+    users = set()
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(*columns).where(*conditions).order_by(ChatMessage.id).limit(settings.chat_retention_chunk_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            if archive:
+                # Archived before the delete commits: a failure leaves the rows in place
+                await asyncio.to_thread(write_archive, archive, rows)
+            await db.execute(delete(ChatMessage).where(ChatMessage.id.in_([row.id for row in rows])))
+            await db.commit()
+
+        chat_retention.stats["deleted"] += len(rows)
+        if archive:
+            chat_retention.stats["archived"] += len(rows)
+        users.update(row.user_id for row in rows)
+        if len(rows) < settings.chat_retention_chunk_size:
+            break
+        await asyncio.sleep(settings.chat_retention_chunk_pause_ms / 1000)
+    return users
+
+async def incremental_vacuum() -> int:
+    """Release free pages to the filesystem; returns the number of pages released"""
+    if not IS_SQLITE or not settings.sqlite_incremental_vacuum:
+        return 0
+    async with async_engine.connect() as connection:
+        if (await connection.exec_driver_sql("PRAGMA auto_vacuum")).scalar() != 2:
+            return 0
+        before = (await connection.exec_driver_sql("PRAGMA freelist_count")).scalar()
+        await connection.commit()
+        pages = settings.sqlite_incremental_vacuum_pages
+        # Each step of the pragma frees one page and a plain execute() only takes the
+        # first step; executescript() runs it to completion
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({pages})")
+        after = (await connection.exec_driver_sql("PRAGMA freelist_count")).scalar()
+    chat_retention.stats["vacuumed_pages"] += before - after
+    return before - after
+
+class ChatRetention:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.stats = {"runs": 0, "deleted": 0, "archived": 0, "cleared_users": 0, "vacuumed_pages": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish pending history clears, then stop the background job"""
+        if self._task is None or self._task.done():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+
+    def visible(self, user_id: int) -> list:
+        """Conditions hiding messages whose clear is still being deleted"""
+        fence = (
+            select(func.coalesce(func.max(ChatHistoryClear.fence_id), 0))
+            .where(ChatHistoryClear.user_id == user_id)
+            .scalar_subquery()
+        )
+        return [ChatMessage.id > fence]
+
+    async def clear_user(self, db: AsyncSession, user_id: int):
+        """Hide the user's history now and delete it in the background"""
+        newest = (await db.execute(select(func.max(ChatMessage.id)).where(ChatMessage.user_id == user_id))).scalar()
+        if newest is None:
+            return
+        await db.execute(insert(ChatHistoryClear).values(user_id=user_id, fence_id=newest))
+        await db.commit()
+        conversation_context.invalidate_user(user_id)
+        self.start()
+        self._wakeup.set()
+
+    async def _process_clears(self):
+        async with AsyncSessionLocal() as db:
+            clears = (await db.execute(
+                select(ChatHistoryClear.id, ChatHistoryClear.user_id, ChatHistoryClear.fence_id)
+                .order_by(ChatHistoryClear.id)
+            )).all()
+        if not clears:
+            return
+        for clear in clears:
+            await delete_chunked([ChatMessage.user_id == clear.user_id, ChatMessage.id <= clear.fence_id])
+            # The fence is lifted with its row; a newer clear of the same user keeps its own
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(ChatHistoryClear).where(ChatHistoryClear.id == clear.id))
+                await db.commit()
+            conversation_context.invalidate_user(clear.user_id)
+            self.stats["cleared_users"] += 1
+        await incremental_vacuum()
+
+    async def enforce(self) -> int:
+        """Apply the age limit and per-user caps once; returns the number of messages deleted"""
+        deleted_before = self.stats["deleted"]
+        archive = archive_path(settings.chat_archive_dir) if settings.chat_archive_dir else None
+        touched = set()
+
+        if settings.chat_retention_max_age_days > 0:
+            cutoff = datetime.utcnow() - timedelta(days=settings.chat_retention_max_age_days)
+            touched |= await delete_chunked([ChatMessage.timestamp < cutoff], archive)
+
+        cap = settings.chat_retention_max_messages_per_user
+        if cap > 0:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(ChatMessage.user_id)
+                    .group_by(ChatMessage.user_id)
+                    .having(func.count(ChatMessage.id) > cap)
+                )
+                over_cap = result.scalars().all()
+            for user_id in over_cap:
+                # The newest message past the cap, via the (user_id, timestamp) index
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(
+                        select(ChatMessage.timestamp, ChatMessage.id)
+                        .where(ChatMessage.user_id == user_id)
+                        .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+                        .offset(cap)
+                        .limit(1)
+                    )
+                    newest_pruned = result.first()
+                if newest_pruned is not None:
+                    pruned = pagination.before(
+                        ChatMessage.timestamp, ChatMessage.id, tuple(newest_pruned), inclusive=True
+                    )
+                    touched |= await delete_chunked([ChatMessage.user_id == user_id, pruned], archive)
+
+        # Summaries may quote turns that are gone now
+        for user_id in touched:
+            conversation_context.invalidate_user(user_id)
+
+        deleted = self.stats["deleted"] - deleted_before
+        if deleted:
+            pages = await incremental_vacuum()
+            logger.info("Chat retention deleted %d messages, released %d pages", deleted, pages)
+        self.stats["runs"] += 1
+        return deleted
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while True:
+            failed = False
+            try:
+                await self._process_clears()
+                if self._stopping:
+                    return
+                if settings.chat_retention_enabled and loop.time() >= next_run:
+                    await self.enforce()
+                    next_run = loop.time() + settings.chat_retention_interval_seconds
+            except Exception:
+                logger.exception("Chat retention run failed")
+                if self._stopping:
+                    return
+                failed = True
+                next_run = loop.time() + settings.chat_retention_interval_seconds
+
+            # With retention disabled only clear_user (or a retry after a failure) wakes the job
+            timeout = None
+            if settings.chat_retention_enabled or failed:
+                timeout = max(next_run - loop.time(), 0.01)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+chat_retention = ChatRetention()
+
+def main(argv: List[str]):
+    from app.database import Base, engine
+
+    if not argv or argv[0] != "run":
+        print("usage: python -m app.chat_retention run")
+        sys.exit(2)
+
+    async def run_once():
+        try:
+            return await chat_retention.enforce()
+        finally:
+            await async_engine.dispose()
+
+    Base.metadata.create_all(bind=engine)
+    deleted = asyncio.run(run_once())
+    print(f"Deleted {deleted} chat messages ({chat_retention.stats['vacuumed_pages']} pages released)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,141 @@
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+from app.config import settings
+
+class CircuitBreaker:
+    """Per-provider circuit breaker over a rolling time window.
+
+    closed:    calls flow normally; outcomes are recorded in the window.
+    open:      the error rate crossed the threshold; calls are rejected
+               immediately until the cooldown has elapsed.
+    half_open: a limited number of probe calls are let through; a success
+               closes the breaker, a failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        # (finished_at, ok, latency_seconds)
+        self._window: Deque[Tuple[float, bool, float]] = deque()
+
+    def _prune(self, now: float):
+        horizon = now - settings.ai_breaker_window_seconds
+        while self._window and self._window[0][0] < horizon:
+            self._window.popleft()
+
+    def _refresh_state(self, now: float):
+        if self.state == self.OPEN and now - self.opened_at >= settings.ai_breaker_cooldown_seconds:
+            # Start from a clean window so the probe gets its normal priority
+            self.state = self.HALF_OPEN
+            self.probes_in_flight = 0
+            self._window.clear()
+
+    def is_available(self) -> bool:
+        """Whether a call could be made right now (does not reserve a probe)"""
+        self._refresh_state(time.monotonic())
+        if self.state == self.OPEN:
+            return False
+        if self.state == self.HALF_OPEN:
+            return self.probes_in_flight < settings.ai_breaker_half_open_probes
+        return True
+
+    def try_acquire(self) -> bool:
+        """Reserve permission for one call; False means skip this provider"""
+        if not self.is_available():
+            return False
+        if self.state == self.HALF_OPEN:
+            self.probes_in_flight += 1
+        return True
+
+    def release(self):
+        """Give back a probe slot for a call that was cancelled before finishing"""
+        if self.state == self.HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record_success(self, latency: float):
+        now = time.monotonic()
+        ok = latency < settings.ai_breaker_slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self.release()
+            if ok:
+                self.state = self.CLOSED
+                self._window.clear()
+        self._window.append((now, ok, latency))
+        self._evaluate(now)
+
+    def record_failure(self, latency: float):
+        now = time.monotonic()
+        self._window.append((now, False, latency))
+        if self.state == self.HALF_OPEN:
+            self.release()
+            self._trip(now)
+            return
+        self._evaluate(now)
+
+    def _evaluate(self, now: float):
+        self._prune(now)
+        if self.state != self.CLOSED or len(self._window) < settings.ai_breaker_min_calls:
+            return
+        if self.error_rate() >= settings.ai_breaker_error_threshold:
+            self._trip(now)
+
+    def _trip(self, now: float):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.probes_in_flight = 0
+
+    def error_rate(self) -> float:
+        """Share of failed or slow calls in the window"""
+        if not self._window:
+            return 0.0
+        return sum(1 for _, ok, _ in self._window if not ok) / len(self._window)
+
+    def average_latency(self) -> float:
+        if not self._window:
+            return 0.0
+        return sum(latency for _, _, latency in self._window) / len(self._window)
+
+    def health_score(self) -> float:
+        """1.0 for a perfectly healthy provider, approaching 0 as it degrades"""
+        self._prune(time.monotonic())
+        # Too few samples to judge: keep the configured priority
+        if len(self._window) < settings.ai_breaker_min_calls:
+            return 1.0
+        latency_penalty = self.average_latency() / settings.ai_breaker_slow_call_seconds
+        return (1.0 - self.error_rate()) / (1.0 + latency_penalty)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "average_latency_seconds": round(self.average_latency(), 3),
+            "health_score": round(self.health_score(), 3),
+            "calls_in_window": len(self._window)
+        }
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(provider_name: str) -> CircuitBreaker:
+    if provider_name not in breakers:
+        breakers[provider_name] = CircuitBreaker(provider_name)
+    return breakers[provider_name]
+
+def order_by_health(providers: List) -> List:
+    """Drop providers whose breaker is open and sort the rest by live health.
+
+    Scores are rounded so that small latency differences do not reshuffle
+    the configured priority order; ties keep the original order.
+    """
+    available = [
+        (index, provider) for index, provider in enumerate(providers)
+        if get_breaker(provider.name).is_available()
+    ]
+    available.sort(key=lambda item: (-round(get_breaker(item[1].name).health_score(), 1), item[0]))
+    return [provider for _, provider in available]
@@ -1,14 +1,37 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./loackin.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    
+    # SQLite performance profile, applied on every new connection
+    sqlite_tuning_enabled: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 65536
+    sqlite_mmap_size: int = 268435456  # 256 MiB
+    sqlite_temp_store: str = "MEMORY"
+    # auto_vacuum=INCREMENTAL so space freed by chat retention can be returned
+    # with `PRAGMA incremental_vacuum` instead of a full VACUUM
+    sqlite_incremental_vacuum: bool = True
+    sqlite_incremental_vacuum_pages: int = 0  # pages released per run, 0 = the whole freelist
     
     # Security
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    auth_cache_ttl_seconds: int = 60  # resolved users / decoded tokens
+    auth_cache_max_entries: int = 10000
+    
+    # Password hashing (bcrypt on a bounded worker pool)
+    bcrypt_rounds: int = 12  # changing this rehashes passwords on next login
+    password_hash_workers: int = 4
+    password_hash_max_pending: int = 64  # beyond this, register/login return 503
     
     # OpenAI
     openai_api_key: Optional[str] = None
@@ -28,6 +51,80 @@ class Settings(BaseSettings):
     github_endpoint: str = "https://models.github.ai/inference"
     github_model: str = "openai/gpt-5"
     
+    # AI HTTP client (shared across providers)
+    ai_request_timeout: float = 30.0
+    ai_max_connections: int = 100
+    ai_max_keepalive_connections: int = 20
+    
+    # AI provider dispatch: "sequential" fallback chain or "hedged" racing
+    ai_dispatch_mode: str = "sequential"
+    ai_request_deadline: float = 45.0  # overall budget shared by all providers
+    ai_hedge_percentile: float = 0.95
+    ai_hedge_default_delay: float = 2.0  # used until enough latency samples exist
+    ai_hedge_min_delay: float = 0.25
+    ai_hedge_min_samples: int = 20
+    ai_latency_window: int = 200
+    
+    # Per-provider circuit breakers
+    ai_breaker_window_seconds: float = 60.0
+    ai_breaker_min_calls: int = 5
+    ai_breaker_error_threshold: float = 0.5
+    ai_breaker_cooldown_seconds: float = 30.0
+    ai_breaker_half_open_probes: int = 1
+    ai_breaker_slow_call_seconds: float = 10.0  # slower calls count against health
+    
+    # AI response cache
+    ai_cache_enabled: bool = True
+    ai_cache_ttl_seconds: int = 3600
+    ai_cache_max_entries: int = 1000
+    ai_cache_sqlite_path: Optional[str] = None  # e.g. "./ai_cache.db" to persist across restarts
+    ai_cache_similarity_enabled: bool = False  # near-duplicate (MinHash) matching
+    ai_cache_similarity_threshold: float = 0.85  # estimated Jaccard over 3-char shingles
+    ai_cache_similarity_min_words: int = 6  # shorter messages (and any with digits) need an exact match
+    
+    # Coalesce identical in-flight prompts into one provider call
+    ai_singleflight_enabled: bool = True
+    
+    # Conversation context sent with each chat message (prompts carrying
+    # history bypass the AI response cache and single-flight; requests can
+    # opt out with AIChatRequest.history = false)
+    ai_context_enabled: bool = True
+    ai_context_max_turns: int = 12  # most recent stored messages considered
+    ai_context_token_budget: int = 1200  # whole prompt: system + context + history + message
+    ai_context_model_budgets: Dict[str, int] = {}  # per-model overrides, e.g. {"gpt-4o-mini": 4000}
+    ai_context_max_context_tokens: int = 300  # cap for the request's free-form context dict
+    ai_context_summary_tokens: int = 200  # summary of turns older than the recent window
+    ai_context_chars_per_token: float = 4.0  # local token estimate
+    ai_context_cache_max_entries: int = 1000
+    ai_context_cache_ttl_seconds: int = 3600
+    
+    # Chat message persistence: "write_behind" returns before the commit,
+    # "durable" waits for it (both batch inserts across requests)
+    chat_persistence_mode: str = "write_behind"
+    chat_write_batch_size: int = 200  # flush once this many messages are queued...
+    chat_write_interval_ms: float = 10.0  # ...or this long after the first one
+    chat_write_queue_max: int = 10000  # enqueueing waits when the queue is full
+    
+    # Chat history retention (background job, chunked deletes)
+    chat_retention_enabled: bool = True
+    chat_retention_max_messages_per_user: int = 5000  # 0 disables the per-user cap
+    chat_retention_max_age_days: int = 365  # 0 disables the age limit
+    chat_retention_interval_seconds: float = 3600.0
+    chat_retention_chunk_size: int = 500  # rows per delete transaction
+    chat_retention_chunk_pause_ms: float = 20.0  # lets other writers in between chunks
+    chat_archive_dir: Optional[str] = None  # e.g. "./chat_archive" to keep pruned turns as .ndjson.gz
+    
+    # Prometheus-style metrics at /metrics
+    metrics_enabled: bool = True
+    
+    # Opt-in request profiling (cProfile + SQL timings), kept for the slowest requests
+    profiling_admin_token: Optional[str] = None  # enables the X-Profile header and /api/admin/profiles
+    profiling_sample_rate: float = 0.0  # fraction of requests profiled without the header
+    profiling_max_profiles: int = 20  # slowest profiles kept
+    profiling_max_statements: int = 200  # SQL statements kept per profile
+    profiling_top_functions: int = 30
+    profiling_tree_min_fraction: float = 0.01  # call tree hides branches below this share of the request
+    
     class Config:
         env_file = ".env"
         extra = "allow"  # Allow extra fields from environment
@@ -1,20 +1,93 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from typing import Dict, List, Tuple
 import os
 
+from app.config import settings
+
 # Database URL - using SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./loackin.db")
 
-# Create engine
+def to_async_url(url: str) -> str:
+    """Map a sync database URL onto its async driver (sqlite -> aiosqlite)"""
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+def pool_options(url: str, is_async: bool = False) -> dict:
+    """Explicit pool sizing; in-memory SQLite uses a single static connection instead"""
+    if url.startswith("sqlite") and make_url(url).database in (None, "", ":memory:"):
+        return {}
+    return {
+        # aiosqlite would otherwise default to NullPool: a new connection per session
+        "poolclass": AsyncAdaptedQueuePool if is_async else QueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout
+    }
+
+# Create engine (sync: used by setup.py and table creation)
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **pool_options(DATABASE_URL)
 )
 
+# Async engine used by the API routers
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, is_async=True))
+
+def sqlite_pragmas() -> List[Tuple[str, str]]:
+    """PRAGMAs of the configured SQLite performance profile"""
+    pragmas = [
+        ("journal_mode", settings.sqlite_journal_mode),
+        ("synchronous", settings.sqlite_synchronous),
+        ("busy_timeout", str(settings.sqlite_busy_timeout_ms)),
+        # Negative cache_size is in KiB rather than pages
+        ("cache_size", str(-settings.sqlite_cache_size_kib)),
+        ("mmap_size", str(settings.sqlite_mmap_size)),
+        ("temp_store", settings.sqlite_temp_store)
+    ]
+    if settings.sqlite_incremental_vacuum:
+        # Takes effect on a new database; existing ones are converted by migrations
+        pragmas.append(("auto_vacuum", "INCREMENTAL"))
+    return pragmas
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+if IS_SQLITE and settings.sqlite_tuning_enabled:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+def get_sqlite_pragmas() -> Dict[str, str]:
+    """Read back the PRAGMA values actually in effect on a pooled connection"""
+    if not IS_SQLITE:
+        return {}
+    values = {}
+    with engine.connect() as connection:
+        for name, _ in sqlite_pragmas():
+            values[name] = str(connection.exec_driver_sql(f"PRAGMA {name}").scalar())
+    return values
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects stay usable after commit so handlers can build responses without reloading
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -24,4 +97,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,306 @@
+"""In-process metrics in the Prometheus text format, served at /metrics.
+
+Covers HTTP requests (per-route latency histograms, in-flight gauge), SQL
+statements (count and latency overall and per request, from SQLAlchemy
+engine events), AI providers (latency, outcomes, failovers and static
+fallbacks) and cache hit ratios read from the caches' own counters at scrape
+time. Everything lives in module-level dicts: one process, one registry.
+"""
+import contextvars
+import re
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from app.config import settings
+
+PREFIX = "lockin_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+AI_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = format_labels(self.label_names + ("le",), labels + (format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            plain = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {format_value(total)}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+class CallbackMetric(Metric):
+    """Counter or gauge whose samples are read from elsewhere at scrape time"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], metric_type: str,
+                 collect: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        super().__init__(name, documentation, labels)
+        self.type = metric_type
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+                for labels, value in self.collect()]
+
+REGISTRY: List[Metric] = []
+
+def register(metric: Metric) -> Metric:
+    REGISTRY.append(metric)
+    return metric
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        samples = metric.samples()
+        if samples:
+            lines.extend(metric.header())
+            lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+# HTTP
+http_requests = register(Counter("http_requests_total", "HTTP requests handled", ("method", "route", "status")))
+http_latency = register(Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+http_in_flight = register(Gauge("http_requests_in_flight", "HTTP requests being handled", ("method",)))
+
+# Database
+db_queries = register(Counter("db_queries_total", "SQL statements executed", ("operation",)))
+db_errors = register(Counter("db_query_errors_total", "SQL statements that raised", ("operation",)))
+db_latency = register(Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ("operation",), DB_LATENCY_BUCKETS
+))
+db_queries_per_request = register(Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ("route",), QUERY_COUNT_BUCKETS
+))
+db_time_per_request = register(Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL per HTTP request", ("route",), DB_LATENCY_BUCKETS
+))
+
+# AI providers
+ai_calls = register(Counter(
+    "ai_provider_calls_total", "AI provider calls by outcome (success, error, timeout, circuit_open, cancelled)",
+    ("provider", "outcome")
+))
+ai_latency = register(Histogram(
+    "ai_provider_duration_seconds", "Latency of successful AI provider calls", ("provider", "mode"), AI_LATENCY_BUCKETS
+))
+ai_failovers = register(Counter("ai_failovers_total", "Answers served by a provider other than the first choice", ("provider",)))
+ai_fallbacks = register(Counter("ai_static_fallbacks_total", "Requests answered by the built-in fallback text"))
+ai_cache_bypasses = register(Counter(
+    "ai_cache_bypasses_total", "AI requests that skipped the response cache and single-flight", ("reason",)
+))
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    # (statement, seconds) of each query, only collected while the request is profiled
+    statements: Optional[List[Tuple[str, float]]] = None
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+OPERATION = re.compile(r"\s*(\w+)")
+
+def operation(statement: str) -> str:
+    match = OPERATION.match(statement)
+    return match.group(1).upper() if match else "OTHER"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    kind = operation(statement)
+    db_queries.inc(kind)
+    db_latency.observe(elapsed, kind)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.statements is not None and len(stats.statements) < settings.profiling_max_statements:
+            stats.statements.append((statement, elapsed))
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+    if started:
+        started.pop()
+    db_errors.inc(operation(exception_context.statement or ""))
+
+def instrument_engine(sync_engine):
+    """Time every statement run through the engine (pass async_engine.sync_engine for async)"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+def route_template(scope) -> str:
+    """The matched route's path template, so labels stay bounded whatever the URL.
+
+    Depending on the FastAPI version the route in the scope carries the full
+    template or only the part below its router's prefix; the prefix is the
+    rest of the concrete path, which has the same number of segments.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "<unmatched>"
+    segments = scope["path"].split("/")
+    return "/".join(segments[:len(segments) - template.count("/")]) + template
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request until its response is complete"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_in_flight.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec(method)
+            current_request.reset(token)
+            # Routing has run by now, so the matched route is known
+            route = route_template(scope)
+            http_requests.inc(method, route, status)
+            http_latency.observe(elapsed, method, route)
+            db_queries_per_request.observe(stats.queries, route)
+            db_time_per_request.observe(stats.db_seconds, route)
+
+def hit_ratio(hits: float, misses: float) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
+
+def register_stats(name: str, collect: Callable[[], Dict[str, float]]):
+    """Expose a component's `stats` counters as lockin_<name>_events_total{event=...}"""
+    register(CallbackMetric(
+        f"{name}_events_total", f"{name} counters", ("event",), "counter",
+        lambda: [((key,), value) for key, value in sorted(collect().items())]
+    ))
+
+def register_cache(name: str, collect: Callable[[], Dict[str, float]], hit_keys: Sequence[str], miss_keys: Sequence[str]):
+    """Expose a cache's counters plus its hit ratio since start"""
+    register_stats(f"cache_{name}", collect)
+
+    def ratio():
+        stats = collect()
+        return [((), hit_ratio(sum(stats[key] for key in hit_keys), sum(stats[key] for key in miss_keys)))]
+
+    register(CallbackMetric(f"cache_{name}_hit_ratio", f"{name} cache hit ratio since start", (), "gauge", ratio))
+
+def register_collectors():
+    """Hook the caches and background workers into the registry (called once from main)"""
+    from app.auth_cache import auth_cache
+    from app.chat_context import conversation_context
+    from app.chat_retention import chat_retention
+    from app.response_cache import response_cache
+    from app.routers.ai_chat import ai_requests
+    from app.write_behind import chat_writer
+
+    register_cache(
+        "ai_response", lambda: response_cache.stats,
+        ("memory_hits", "disk_hits", "similar_hits"), ("misses",)
+    )
+    register_cache(
+        "auth", auth_cache.stats,
+        ("token_hits", "principal_hits"), ("token_misses", "principal_misses")
+    )
+    summaries = conversation_context.summaries
+    register_cache(
+        "conversation_summary", lambda: {"hits": summaries.hits, "misses": summaries.misses}, ("hits",), ("misses",)
+    )
+    # Followers are requests served by another request's in-flight provider call
+    register_cache("ai_singleflight", lambda: ai_requests.stats, ("followers",), ("leaders",))
+    register_stats("conversation_context", lambda: conversation_context.stats)
+    register_stats("chat_writer", lambda: chat_writer.stats)
+    register_stats("chat_retention", lambda: chat_retention.stats)
+    register(CallbackMetric(
+        "chat_writer_queued_messages", "Chat messages waiting to be written", (), "gauge",
+        lambda: [((), chat_writer.pending())]
+    ))
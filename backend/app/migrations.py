@@ -0,0 +1,108 @@
+import logging
+
+from pydantic import ValidationError
+from sqlalchemy import and_, exists, insert, inspect, or_, select
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.database import Base
+from app.models import PlanSubject, PlanTimeSlot, StudyPlan, StudySession, StudyStatsDaily
+from app import plan_storage, stats_rollup
+
+logger = logging.getLogger(__name__)
+
+def create_missing_indexes(connection) -> list:
+    """Create indexes declared on the models that an existing database lacks.
+
+    Base.metadata.create_all only creates missing tables, so indexes added
+    to tables that already exist (e.g. in an old loackin.db) need this step.
+    """
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+                created.append(index.name)
+    return created
+
+def backfill_stats_rollup(connection) -> int:
+    """Populate study_stats_daily the first time it exists next to old sessions"""
+    has_rollups = connection.execute(select(StudyStatsDaily.id).limit(1)).first()
+    has_sessions = connection.execute(select(StudySession.id).limit(1)).first()
+    if has_rollups or not has_sessions:
+        return 0
+    return stats_rollup.rebuild(connection)
+
+def backfill_plan_children(connection) -> int:
+    """Copy plans stored as legacy JSON text into plan_subjects / plan_time_slots.
+
+    Only plans with non-empty JSON and no child rows yet are touched, so this
+    runs once per plan. The JSON columns are left in place.
+    """
+    def has_json(column):
+        return and_(column.isnot(None), column.notin_(["", "[]"]))
+
+    legacy_plans = connection.execute(
+        select(StudyPlan.id, StudyPlan.subjects, StudyPlan.time_slots)
+        .where(
+            or_(has_json(StudyPlan.subjects), has_json(StudyPlan.time_slots)),
+            ~exists().where(PlanSubject.study_plan_id == StudyPlan.id),
+            ~exists().where(PlanTimeSlot.study_plan_id == StudyPlan.id)
+        )
+    ).all()
+
+    migrated = 0
+    for plan_id, subjects_json, time_slots_json in legacy_plans:
+        try:
+            subjects, time_slots = plan_storage.legacy_children(subjects_json, time_slots_json)
+        except (ValueError, TypeError, ValidationError):
+            logger.warning("Skipping study plan %d: unreadable subjects/time_slots JSON", plan_id)
+            continue
+        if subjects:
+            connection.execute(insert(PlanSubject), [{"study_plan_id": plan_id, **values} for values in subjects])
+        if time_slots:
+            connection.execute(insert(PlanTimeSlot), [{"study_plan_id": plan_id, **values} for values in time_slots])
+        migrated += 1
+    return migrated
+
+def enable_incremental_vacuum(engine: Engine) -> bool:
+    """Switch an existing SQLite database to auto_vacuum=INCREMENTAL.
+
+    The mode of a database that already has tables only changes with a full
+    VACUUM, which rewrites the file once; afterwards chat retention can hand
+    freed pages back with `PRAGMA incremental_vacuum`.
+    """
+    if engine.dialect.name != "sqlite" or not settings.sqlite_incremental_vacuum:
+        return False
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return False
+        connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+        return connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+
+def run_migrations(engine: Engine):
+    """Bring an existing database up to date with the models (idempotent)"""
+    with engine.begin() as connection:
+        created = create_missing_indexes(connection)
+        if created:
+            # Refresh planner statistics so the new indexes get used
+            connection.exec_driver_sql("ANALYZE")
+            logger.info("Created indexes: %s", ", ".join(created))
+        
+        rollup_rows = backfill_stats_rollup(connection)
+        if rollup_rows:
+            logger.info("Backfilled %d study stats rollup rows", rollup_rows)
+        
+        migrated_plans = backfill_plan_children(connection)
+        if migrated_plans:
+            logger.info("Moved %d study plans to plan_subjects / plan_time_slots", migrated_plans)
+    
+    if enable_incremental_vacuum(engine):
+        logger.info("Converted the database to auto_vacuum=INCREMENTAL")
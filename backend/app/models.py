@@ -1,8 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Text, ForeignKey, Float, Index, UniqueConstraint
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
+# Columns filled by server_default=func.now() hold SQLite's CURRENT_TIMESTAMP
+# format (no fractional seconds); bound values must use the same text format,
+# or keyset comparisons on these columns (app.pagination) compare wrongly.
+ServerTimestamp = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -16,25 +25,85 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    study_plans = relationship("StudyPlan", back_populates="user")
-    sessions = relationship("StudySession", back_populates="user")
+    study_plans = relationship("StudyPlan", back_populates="user", lazy="raise")
+    sessions = relationship("StudySession", back_populates="user", lazy="raise")
 
 class StudyPlan(Base):
     __tablename__ = "study_plans"
+    __table_args__ = (
+        # Latest plan / plan history per user
+        Index("ix_study_plans_user_generated_at", "user_id", "generated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     study_method = Column(String, nullable=False)  # pomodoro, active-recall, etc.
-    subjects = Column(Text)  # JSON string of subjects
-    time_slots = Column(Text)  # JSON string of time slots
-    generated_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Legacy JSON strings; plans are stored in plan_subjects / plan_time_slots
+    # (see app.migrations.backfill_plan_children) and these are no longer written
+    subjects = deferred(Column(Text))
+    time_slots = deferred(Column(Text))
+    generated_at = Column(ServerTimestamp, server_default=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="study_plans")
-    sessions = relationship("StudySession", back_populates="study_plan")
+    user = relationship("User", back_populates="study_plans", lazy="raise")
+    sessions = relationship("StudySession", back_populates="study_plan", lazy="raise")
+    plan_subjects = relationship(
+        "PlanSubject", back_populates="study_plan", order_by="PlanSubject.position", cascade="all, delete-orphan",
+        lazy="raise"
+    )
+    plan_time_slots = relationship(
+        "PlanTimeSlot", back_populates="study_plan", order_by="PlanTimeSlot.position", cascade="all, delete-orphan",
+        lazy="raise"
+    )
+
+class PlanSubject(Base):
+    __tablename__ = "plan_subjects"
+    __table_args__ = (
+        Index("ix_plan_subjects_study_plan_id", "study_plan_id"),
+        # Which plans (and so users) study a given subject
+        Index("ix_plan_subjects_name_study_plan_id", "name", "study_plan_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    study_plan_id = Column(Integer, ForeignKey("study_plans.id"), nullable=False)
+    position = Column(Integer, nullable=False)  # order within the plan
+    name = Column(String, nullable=False)
+    difficulty = Column(String, nullable=False)  # easy, medium, hard
+    priority = Column(String, nullable=False)  # low, medium, high
+    hours_per_week = Column(Integer, nullable=False)
+    
+    # Relationships
+    study_plan = relationship("StudyPlan", back_populates="plan_subjects", lazy="raise")
+
+class PlanTimeSlot(Base):
+    __tablename__ = "plan_time_slots"
+    __table_args__ = (
+        # A plan's slots for a given weekday (e.g. free slots on Tuesday)
+        Index("ix_plan_time_slots_plan_weekday", "study_plan_id", "weekday", "start_minute"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    study_plan_id = Column(Integer, ForeignKey("study_plans.id"), nullable=False)
+    position = Column(Integer, nullable=False)  # order within the plan
+    day = Column(String, nullable=False)  # as submitted, e.g. "Tuesday"
+    start_time = Column(String, nullable=False)  # as submitted, "HH:MM"
+    end_time = Column(String, nullable=False)
+    is_available = Column(Boolean, nullable=False, default=True)
+    # Parsed forms for querying; NULL when the submitted value is not recognised
+    weekday = Column(Integer, nullable=True)  # 0 = Monday
+    start_minute = Column(Integer, nullable=True)  # minutes from midnight
+    end_minute = Column(Integer, nullable=True)
+    
+    # Relationships
+    study_plan = relationship("StudyPlan", back_populates="plan_time_slots", lazy="raise")
 
 class StudySession(Base):
     __tablename__ = "study_sessions"
+    __table_args__ = (
+        # Per-user time-range queries (calendar week/upcoming/stats, session lists)
+        Index("ix_study_sessions_user_start_time", "user_id", "start_time"),
+        Index("ix_study_sessions_study_plan_id", "study_plan_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -49,17 +118,102 @@ class StudySession(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="sessions")
-    study_plan = relationship("StudyPlan", back_populates="sessions")
+    user = relationship("User", back_populates="sessions", lazy="raise")
+    study_plan = relationship("StudyPlan", back_populates="sessions", lazy="raise")
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Chat history per user, newest first
+        Index("ix_chat_messages_user_timestamp", "user_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     content = Column(Text, nullable=False)
     role = Column(String, nullable=False)  # user or assistant
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(ServerTimestamp, server_default=func.now())
     
     # Relationships
-    user = relationship("User") 
\ No newline at end of file
+    user = relationship("User", lazy="raise")
+
+class ChatHistoryClear(Base):
+    """A pending "clear my history": the user's messages up to fence_id are hidden
+    until the retention job has deleted them, then the row is removed"""
+    __tablename__ = "chat_history_clears"
+    __table_args__ = (
+        Index("ix_chat_history_clears_user_fence", "user_id", "fence_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    fence_id = Column(Integer, nullable=False)  # newest chat_messages.id being cleared
+    created_at = Column(ServerTimestamp, server_default=func.now())
+
+class StudyStatsDaily(Base):
+    """Per user x day x subject x session_type rollup of study_sessions.
+
+    Maintained incrementally by the session endpoints and rebuilt with
+    `python -m app.stats_rollup rebuild`.
+    """
+    __tablename__ = "study_stats_daily"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "subject", "session_type", name="uq_study_stats_daily_group"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    subject = Column(String, nullable=False)
+    session_type = Column(String, nullable=False)
+    session_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Integer, nullable=False, default=0)
+
+class StudyRecurrence(Base):
+    """RRULE-like rule for repeating study sessions (FREQ, INTERVAL, BYDAY, UNTIL, COUNT).
+
+    Occurrences are never stored; they are expanded on read for the requested
+    window (see app.recurrence). Only per-occurrence changes are persisted,
+    as StudyOccurrenceOverride rows.
+    """
+    __tablename__ = "study_recurrences"
+    __table_args__ = (
+        Index("ix_study_recurrences_user_id", "user_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    study_plan_id = Column(Integer, ForeignKey("study_plans.id"), nullable=True)
+    subject = Column(String, nullable=False)
+    session_type = Column(String, nullable=False, default="focus")
+    frequency = Column(String, nullable=False)  # daily, weekly
+    interval = Column(Integer, nullable=False, default=1)
+    by_weekday = Column(String, nullable=True)  # "0,2,4" (0 = Monday), weekly only
+    dtstart = Column(DateTime(timezone=True), nullable=False)  # first occurrence
+    duration = Column(Integer, nullable=False)  # in minutes
+    until = Column(DateTime(timezone=True), nullable=True)
+    count = Column(Integer, nullable=True)
+    notes = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    @property
+    def weekdays(self):
+        if not self.by_weekday:
+            return [self.dtstart.weekday()] if self.frequency == "weekly" else []
+        return sorted({int(day) for day in self.by_weekday.split(",")})
+
+class StudyOccurrenceOverride(Base):
+    """Sparse per-occurrence change to a StudyRecurrence (completion, notes, deletion)"""
+    __tablename__ = "study_occurrence_overrides"
+    __table_args__ = (
+        UniqueConstraint("recurrence_id", "occurrence_start", name="uq_study_occurrence_overrides_occurrence"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    recurrence_id = Column(Integer, ForeignKey("study_recurrences.id"), nullable=False)
+    occurrence_start = Column(DateTime(timezone=True), nullable=False)  # original start of the occurrence
+    completed = Column(Boolean, default=False)
+    notes = Column(Text, nullable=True)
+    is_deleted = Column(Boolean, default=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
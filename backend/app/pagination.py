@@ -0,0 +1,59 @@
+"""Keyset (cursor) pagination over (timestamp column, id), newest first.
+
+A page is fetched with `WHERE (ts, id) < (cursor_ts, cursor_id) ORDER BY ts DESC,
+id DESC LIMIT n + 1`, which walks the per-user ordering indexes (on SQLite the
+rowid id is part of every index entry) straight to the cursor. Page N therefore
+costs the same as page 1, unlike OFFSET. List bodies are unchanged; the cursor
+for the next page is returned in the X-Next-Cursor header. The (ts, id)
+comparisons (`before`, `after`) are shared with the other keyset walks over
+chat_messages (conversation summaries, retention).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(value: datetime, row_id: int) -> str:
+    raw = json.dumps([value.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        return datetime.fromisoformat(value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def before(order_column, id_column, key: Tuple[datetime, int], inclusive: bool = False):
+    """(order_column, id_column) < key, or <= key when inclusive"""
+    value, row_id = key
+    id_bound = id_column <= row_id if inclusive else id_column < row_id
+    return or_(order_column < value, and_(order_column == value, id_bound))
+
+def after(order_column, id_column, key: Tuple[datetime, int]):
+    """(order_column, id_column) > key"""
+    value, row_id = key
+    return or_(order_column > value, and_(order_column == value, id_column > row_id))
+
+def paginate(statement, order_column, id_column, cursor: Optional[str], limit: int):
+    """Apply newest-first keyset ordering, the cursor predicate and limit + 1 to a select"""
+    if cursor:
+        key = decode_cursor(cursor)
+        # The redundant `order_column <= value` gives the planner a plain range bound
+        statement = statement.where(order_column <= key[0], before(order_column, id_column, key))
+    return statement.order_by(order_column.desc(), id_column.desc()).limit(limit + 1)
+
+def page_rows(rows, limit: int, response: Response, order_attribute: str):
+    """Trim the look-ahead row and set X-Next-Cursor when another page exists"""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, order_attribute), last.id)
+    return rows
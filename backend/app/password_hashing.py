@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashing jobs are already queued (load shedding)"""
+
+class PasswordHasher:
+    """Runs bcrypt on a dedicated, size-limited thread pool.
+
+    bcrypt is deliberately slow (~100-300ms) but releases the GIL, so a few
+    worker threads keep the event loop free while hashing in parallel.
+    Jobs beyond `password_hash_max_pending` are rejected instead of queued.
+    """
+
+    def __init__(self):
+        rounds = settings.bcrypt_rounds
+        # min == max == default: hashes with any other cost are flagged for rehash
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            thread_name_prefix="password-hash"
+        )
+        self.pending = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        if self.pending >= settings.password_hash_max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Check a password; also returns a new hash if the stored one uses an outdated cost"""
+        if not hashed_password:
+            # OAuth-only accounts have no password
+            return False, None
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,100 @@
+"""Mapping between study plan schemas and the plan_subjects / plan_time_slots rows.
+
+Plans used to be stored as json.dumps() text in StudyPlan.subjects/time_slots.
+The API keeps returning those JSON strings (StudyPlanResponse), now rendered
+from the child rows, so clients see the same contract.
+"""
+import json
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import selectinload
+
+from app.models import PlanSubject, PlanTimeSlot, StudyPlan
+from app.scheduler import WEEKDAYS, ScheduleError, parse_clock
+from app.schemas import StudyPlanResponse, SubjectSchema, TimeSlotSchema
+
+# Query options loading a plan's children in one extra IN query per relationship
+PLAN_CHILDREN = (selectinload(StudyPlan.plan_subjects), selectinload(StudyPlan.plan_time_slots))
+
+def weekday_number(day: str) -> Optional[int]:
+    day = day.strip().lower()
+    return WEEKDAYS.index(day) if day in WEEKDAYS else None
+
+def clock_minutes(value: str) -> Optional[int]:
+    try:
+        return parse_clock(value)
+    except ScheduleError:
+        return None
+
+def subject_values(subjects: Iterable[SubjectSchema]) -> List[dict]:
+    return [
+        {
+            "position": position,
+            "name": subject.name,
+            "difficulty": subject.difficulty,
+            "priority": subject.priority,
+            "hours_per_week": subject.hours_per_week
+        }
+        for position, subject in enumerate(subjects)
+    ]
+
+def time_slot_values(time_slots: Iterable[TimeSlotSchema]) -> List[dict]:
+    return [
+        {
+            "position": position,
+            "day": slot.day,
+            "start_time": slot.start_time,
+            "end_time": slot.end_time,
+            "is_available": slot.is_available,
+            "weekday": weekday_number(slot.day),
+            "start_minute": clock_minutes(slot.start_time),
+            "end_minute": clock_minutes(slot.end_time)
+        }
+        for position, slot in enumerate(time_slots)
+    ]
+
+def build_children(subjects: Iterable[SubjectSchema],
+                   time_slots: Iterable[TimeSlotSchema]) -> Tuple[List[PlanSubject], List[PlanTimeSlot]]:
+    return (
+        [PlanSubject(**values) for values in subject_values(subjects)],
+        [PlanTimeSlot(**values) for values in time_slot_values(time_slots)]
+    )
+
+def plan_subjects(plan: StudyPlan) -> List[SubjectSchema]:
+    return [
+        SubjectSchema(
+            name=row.name,
+            difficulty=row.difficulty,
+            priority=row.priority,
+            hours_per_week=row.hours_per_week
+        )
+        for row in plan.plan_subjects
+    ]
+
+def plan_time_slots(plan: StudyPlan) -> List[TimeSlotSchema]:
+    return [
+        TimeSlotSchema(
+            day=row.day,
+            start_time=row.start_time,
+            end_time=row.end_time,
+            is_available=row.is_available
+        )
+        for row in plan.plan_time_slots
+    ]
+
+def plan_response(plan: StudyPlan) -> StudyPlanResponse:
+    """StudyPlanResponse with subjects/time_slots rendered as the historical JSON strings"""
+    return StudyPlanResponse(
+        id=plan.id,
+        user_id=plan.user_id,
+        study_method=plan.study_method,
+        subjects=json.dumps([subject.model_dump() for subject in plan_subjects(plan)]),
+        time_slots=json.dumps([slot.model_dump() for slot in plan_time_slots(plan)]),
+        generated_at=plan.generated_at
+    )
+
+def legacy_children(subjects_json: Optional[str], time_slots_json: Optional[str]) -> Tuple[List[dict], List[dict]]:
+    """Child row values parsed from a plan's legacy JSON text columns"""
+    subjects = [SubjectSchema(**subject) for subject in json.loads(subjects_json or "[]")]
+    time_slots = [TimeSlotSchema(**slot) for slot in json.loads(time_slots_json or "[]")]
+    return subject_values(subjects), time_slot_values(time_slots)
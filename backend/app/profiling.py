@@ -0,0 +1,253 @@
+"""Opt-in request profiling with slow-request capture.
+
+A request is profiled when it carries `X-Profile: <profiling_admin_token>`
+or is picked by `profiling_sample_rate`. It then runs under cProfile and
+every SQL statement it issues is timed (through the metrics engine hooks).
+The slowest `profiling_max_profiles` profiles are kept in memory and served
+by /api/admin/profiles. The response of a profiled request carries its id
+in X-Profile-Id.
+
+cProfile sees the whole event loop thread, so work of other requests running
+concurrently shows up in the call tree as well. Only one request is profiled
+at a time; others that would be sampled meanwhile simply run unprofiled.
+"""
+import cProfile
+import heapq
+import itertools
+import os
+import pstats
+import random
+import secrets
+import sysconfig
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.metrics import RequestStats, current_request
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+MAX_TREE_DEPTH = 40
+MAX_TREE_LINES = 400
+
+@dataclass
+class Profile:
+    id: int
+    method: str
+    path: str
+    status: int
+    duration_seconds: float
+    started_at: datetime
+    trigger: str  # "header" or "sample"
+    sql_count: int = 0
+    sql_seconds: float = 0.0
+    sql: List[dict] = field(default_factory=list)
+    functions: List[dict] = field(default_factory=list)
+    call_tree: List[str] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        data = asdict(self)
+        for detail in ("sql", "functions", "call_tree"):
+            data.pop(detail)
+        return data
+
+STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+def function_label(function: Tuple[str, int, str]) -> str:
+    filename, line, name = function
+    if filename == "~":
+        return name  # built-in
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        filename = filename[len(cwd):]
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(STDLIB):
+        filename = filename[len(STDLIB):]
+    return f"{filename}:{line}({name})"
+
+def top_functions(stats: pstats.Stats, limit: int) -> List[dict]:
+    """Functions by own time: unlike cumulative time it is not skewed by coroutine resumptions"""
+    stats.sort_stats("tottime")
+    functions = []
+    for function in stats.fcn_list[:limit]:
+        primitive_calls, calls, own_seconds, cumulative_seconds, _ = stats.stats[function]
+        functions.append({
+            "function": function_label(function),
+            "calls": calls,
+            "own_seconds": round(own_seconds, 6),
+            "cumulative_seconds": round(cumulative_seconds, 6)
+        })
+    return functions
+
+def code_key(function) -> Tuple[str, int, str]:
+    """The pstats key of a Python function"""
+    code = function.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+def call_tree(stats: pstats.Stats, min_seconds: float, entries: Sequence[tuple] = ()) -> List[str]:
+    """Indented caller -> callee tree weighted by per-edge cumulative time.
+
+    cProfile sees a coroutine's first run and each resumption as separate
+    calls: the first run of the wrapped app has no caller, later ones are
+    called by the (resumed) middleware frame. Both are given as `entries` and
+    used as roots; without them, functions with no caller are.
+    """
+    children: Dict[tuple, List[Tuple[float, tuple]]] = defaultdict(list)
+    roots = []
+    for function, (_, _, _, cumulative_seconds, callers) in stats.stats.items():
+        if not callers:
+            roots.append((cumulative_seconds, function))
+        for caller, edge in callers.items():
+            # cProfile edges are (primitive calls, calls, own time, cumulative time)
+            children[caller].append((edge[3], function))
+    profiled_entries = [(stats.stats[entry][3], entry) for entry in entries if entry in stats.stats]
+    if profiled_entries:
+        roots = profiled_entries
+
+    lines = []
+
+    def walk(function, seconds, depth, path):
+        if seconds < min_seconds or depth > MAX_TREE_DEPTH or function in path or len(lines) >= MAX_TREE_LINES:
+            return
+        lines.append(f"{'  ' * depth}{seconds:.4f}s {function_label(function)}")
+        for child_seconds, child in sorted(children[function], reverse=True):
+            walk(child, child_seconds, depth + 1, path | {function})
+
+    for seconds, function in sorted(roots, reverse=True):
+        walk(function, seconds, 0, frozenset())
+    return lines
+
+class ProfileStore:
+    """The slowest profiles seen since start (or the last clear)"""
+
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self._heap: List[Tuple[float, int, Profile]] = []  # min-heap on duration
+        self._ids = itertools.count(1)
+        self.stats = {"profiled": 0, "kept": 0}
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, profile: Profile):
+        self.stats["profiled"] += 1
+        entry = (profile.duration_seconds, profile.id, profile)
+        if len(self._heap) < self.max_profiles:
+            heapq.heappush(self._heap, entry)
+        elif profile.duration_seconds > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+        else:
+            return
+        self.stats["kept"] += 1
+
+    def would_keep(self, duration_seconds: float) -> bool:
+        return len(self._heap) < self.max_profiles or duration_seconds > self._heap[0][0]
+
+    def slowest(self) -> List[Profile]:
+        return [profile for _, _, profile in sorted(self._heap, reverse=True)]
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        return next((profile for _, pid, profile in self._heap if pid == profile_id), None)
+
+    def clear(self):
+        self._heap.clear()
+
+profile_store = ProfileStore(settings.profiling_max_profiles)
+
+def is_admin_token(token: Optional[str]) -> bool:
+    expected = settings.profiling_admin_token
+    return bool(expected and token) and secrets.compare_digest(token.encode(), expected.encode())
+
+def requested_trigger(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER.encode():
+            return "header" if is_admin_token(value.decode("latin-1")) else None
+    if settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate:
+        return "sample"
+    return None
+
+class ProfilingMiddleware:
+    """ASGI middleware running opted-in requests under cProfile with SQL capture"""
+
+    def __init__(self, app):
+        self.app = app
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active:
+            await self.app(scope, receive, send)
+            return
+        trigger = requested_trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = profile_store.next_id()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.lower().encode(), str(profile_id).encode())
+                ]
+            await send(message)
+
+        # Reuse the metrics middleware's per-request stats when it runs outside us
+        stats = current_request.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = current_request.set(stats)
+        stats.statements = []
+        queries_before, db_seconds_before = stats.queries, stats.db_seconds
+
+        profiler = cProfile.Profile()
+        self._active = True
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            self._active = False
+            if token is not None:
+                current_request.reset(token)
+            statements, stats.statements = stats.statements, None
+            if profile_store.would_keep(duration):
+                profile = build_profile(
+                    profile_id, scope, status, duration, started_at, trigger, profiler, statements,
+                    (code_key(type(self.app).__call__), code_key(ProfilingMiddleware.__call__))
+                )
+                # Totals include statements beyond profiling_max_statements
+                profile.sql_count = stats.queries - queries_before
+                profile.sql_seconds = round(stats.db_seconds - db_seconds_before, 6)
+                profile_store.add(profile)
+            else:
+                profile_store.stats["profiled"] += 1
+
+def build_profile(profile_id: int, scope, status: int, duration: float, started_at: datetime,
+                  trigger: str, profiler: cProfile.Profile, statements: List[Tuple[str, float]],
+                  entries: Sequence[tuple] = ()) -> Profile:
+    stats = pstats.Stats(profiler)
+    return Profile(
+        id=profile_id,
+        method=scope["method"],
+        path=scope["path"],
+        status=status,
+        duration_seconds=round(duration, 6),
+        started_at=started_at,
+        trigger=trigger,
+        sql_count=len(statements),
+        sql_seconds=round(sum(seconds for _, seconds in statements), 6),
+        sql=[{"statement": statement, "seconds": round(seconds, 6)} for statement, seconds in statements],
+        functions=top_functions(stats, settings.profiling_top_functions),
+        call_tree=call_tree(stats, duration * settings.profiling_tree_min_fraction, entries)
+    )
@@ -0,0 +1,31 @@
+"""Loader options and query helpers that fetch only what a handler needs.
+
+Relationships are `lazy="raise"` (see app.models): anything a handler needs
+beyond the selected row must be loaded explicitly (selectinload, a join or a
+separate select), so an accidental N+1 fails loudly instead of silently
+issuing one query per row.
+"""
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+
+from app.models import StudySession, User
+
+# What ownership checks, completion and stats rollup deltas need (not notes)
+SESSION_STATE = load_only(
+    StudySession.id,
+    StudySession.user_id,
+    StudySession.subject,
+    StudySession.session_type,
+    StudySession.start_time,
+    StudySession.duration,
+    StudySession.completed
+)
+
+# Columns behind an auth_cache.UserPrincipal
+PRINCIPAL_COLUMNS = (User.id, User.email, User.username, User.is_active)
+
+async def count_rows(db: AsyncSession, model, *conditions) -> int:
+    """SELECT COUNT(*) instead of loading rows just to len() them"""
+    result = await db.execute(select(func.count()).select_from(model).where(*conditions))
+    return result.scalar_one()
@@ -0,0 +1,133 @@
+"""Lazy expansion of recurring study sessions.
+
+A StudyRecurrence stores the rule only; occurrences are generated on demand
+for the window being read, starting directly at the first period that can
+overlap it (no iteration from dtstart). Overrides are applied on the fly and
+the per-rule streams are merged with concrete StudySession rows by start time,
+so storage stays O(rules + overrides) however long a plan runs.
+"""
+import heapq
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import StudyOccurrenceOverride, StudyRecurrence
+
+FREQUENCIES = ("daily", "weekly")
+
+OverrideMap = Dict[Tuple[int, datetime], StudyOccurrenceOverride]
+
+def iter_occurrences(rule: StudyRecurrence, start: datetime, end: Optional[datetime] = None) -> Iterator[datetime]:
+    """Start times of the rule's occurrences in [start, end), in order (end=None: unbounded)"""
+    if rule.frequency == "daily":
+        period = timedelta(days=rule.interval)
+        # Jump straight to the first period at or after `start`
+        index = max(0, math.ceil((start - rule.dtstart) / period))
+        while True:
+            occurrence = rule.dtstart + index * period
+            if (rule.count is not None and index >= rule.count) or (rule.until and occurrence > rule.until):
+                return
+            if end is not None and occurrence >= end:
+                return
+            yield occurrence
+            index += 1
+
+    days = rule.weekdays
+    week0 = datetime.combine(rule.dtstart.date() - timedelta(days=rule.dtstart.weekday()), rule.dtstart.time())
+    # Weekdays of the first week that fall before dtstart are not occurrences
+    skipped = sum(1 for day in days if week0 + timedelta(days=day) < rule.dtstart)
+    period = max(0, (start - week0).days // (7 * rule.interval))
+    while True:
+        week = week0 + timedelta(weeks=period * rule.interval)
+        for position, day in enumerate(days):
+            index = period * len(days) + position - skipped
+            if index < 0:
+                continue
+            occurrence = week + timedelta(days=day)
+            if (rule.count is not None and index >= rule.count) or (rule.until and occurrence > rule.until):
+                return
+            if end is not None and occurrence >= end:
+                return
+            if occurrence >= start:
+                yield occurrence
+        period += 1
+
+def is_occurrence(rule: StudyRecurrence, moment: datetime) -> bool:
+    return next(iter_occurrences(rule, moment, moment + timedelta(microseconds=1)), None) == moment
+
+def occurrence_dict(rule: StudyRecurrence, occurrence: datetime, override: Optional[StudyOccurrenceOverride]) -> dict:
+    """An occurrence shaped like a StudySessionResponse (id is None, recurrence_id is set)"""
+    return {
+        "id": None,
+        "recurrence_id": rule.id,
+        "user_id": rule.user_id,
+        "study_plan_id": rule.study_plan_id,
+        "subject": rule.subject,
+        "start_time": occurrence,
+        "end_time": occurrence + timedelta(minutes=rule.duration),
+        "duration": rule.duration,
+        "session_type": rule.session_type,
+        "completed": bool(override and override.completed),
+        "notes": override.notes if override and override.notes is not None else rule.notes,
+        "created_at": rule.created_at
+    }
+
+def expand(rules: Iterable[StudyRecurrence], overrides: OverrideMap, start: datetime,
+           end: Optional[datetime] = None) -> Iterator[dict]:
+    """All rules' occurrences in [start, end) with overrides applied, merged by start time"""
+    def stream(rule):
+        for occurrence in iter_occurrences(rule, start, end):
+            override = overrides.get((rule.id, occurrence))
+            if override is not None and override.is_deleted:
+                continue
+            yield occurrence_dict(rule, occurrence, override)
+
+    return heapq.merge(*(stream(rule) for rule in rules), key=lambda item: item["start_time"])
+
+async def load_window(db: AsyncSession, user_id: int, start: datetime,
+                      end: Optional[datetime] = None) -> Tuple[List[StudyRecurrence], OverrideMap]:
+    """Rules that can produce occurrences in [start, end) and their overrides in that window"""
+    conditions = [
+        StudyRecurrence.user_id == user_id,
+        or_(StudyRecurrence.until.is_(None), StudyRecurrence.until >= start)
+    ]
+    if end is not None:
+        conditions.append(StudyRecurrence.dtstart < end)
+    result = await db.execute(select(StudyRecurrence).where(*conditions))
+    rules = result.scalars().all()
+    if not rules:
+        return [], {}
+
+    override_conditions = [
+        StudyOccurrenceOverride.recurrence_id.in_([rule.id for rule in rules]),
+        StudyOccurrenceOverride.occurrence_start >= start
+    ]
+    if end is not None:
+        override_conditions.append(StudyOccurrenceOverride.occurrence_start < end)
+    result = await db.execute(select(StudyOccurrenceOverride).where(*override_conditions))
+    overrides = {
+        (override.recurrence_id, override.occurrence_start): override
+        for override in result.scalars().all()
+    }
+    return rules, overrides
+
+def merge_with_sessions(sessions: Iterable, occurrences: Iterator[dict]) -> Iterator:
+    """Merge concrete sessions (ordered by start_time) with expanded occurrences"""
+    return heapq.merge(
+        sessions,
+        occurrences,
+        key=lambda item: item["start_time"] if isinstance(item, dict) else item.start_time
+    )
+
+async def summarize_occurrences(db: AsyncSession, groups: dict, user_id: int, start: datetime, end: datetime):
+    """Add occurrences starting in [start, end] to stats groups (see stats_rollup.summarize_sessions)"""
+    end = end + timedelta(microseconds=1)
+    rules, overrides = await load_window(db, user_id, start, end)
+    for occurrence in expand(rules, overrides, start, end):
+        totals = groups.setdefault((occurrence["session_type"], occurrence["subject"]), [0, 0, 0])
+        totals[0] += 1
+        totals[1] += 1 if occurrence["completed"] else 0
+        totals[2] += occurrence["duration"]
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from app.config import settings
+from app.lru_cache import LRUCache
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+_DIGIT = re.compile(r"\d")
+
+def normalize_message(message: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing ?!. (other punctuation
+    such as 2+2 vs 2-2 or C++ vs C changes the question and is kept)"""
+    text = _WHITESPACE.sub(" ", message.lower()).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+def similarity_eligible(normalized: str) -> bool:
+    """Near-duplicate matching is only safe for longer, digit-free messages:
+    in short ones a single changed character (2+2 vs 2+3) is the whole question"""
+    return len(normalized.split()) >= settings.ai_cache_similarity_min_words and not _DIGIT.search(normalized)
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class SQLiteCacheStore:
+    """On-disk tier that survives restarts (blocking; call via a worker thread)"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM ai_response_cache WHERE key = ? AND expires_at >= ?",
+                (key, time.time())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, response: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, expires_at)
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class MinHashIndex:
+    """Near-duplicate lookup over character shingles using MinHash + LSH banding"""
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 3):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        seed = hashlib.sha256(b"lockin-minhash").digest()
+        rng = int.from_bytes(seed, "big")
+        self._perms = []
+        for _ in range(num_perm):
+            rng = (rng * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            a = rng % self._PRIME or 1
+            rng = (rng * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            self._perms.append((a, rng % self._PRIME))
+        self._signatures: Dict[str, Tuple[str, Tuple[int, ...]]] = {}
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+
+    def _shingles(self, text: str) -> Set[int]:
+        padded = f" {text} "
+        size = self.shingle_size
+        grams = {padded[i:i + size] for i in range(max(1, len(padded) - size + 1))}
+        return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        shingles = self._shingles(text)
+        prime = self._PRIME
+        return tuple(min((a * s + b) % prime for s in shingles) for a, b in self._perms)
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, key: str, scope: str, text: str):
+        signature = self.signature(text)
+        self._signatures[key] = (scope, signature)
+        for band_key in self._band_keys(scope, signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        entry = self._signatures.pop(key, None)
+        if entry is None:
+            return
+        scope, signature = entry
+        for band_key in self._band_keys(scope, signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, scope: str, text: str, threshold: float) -> Optional[str]:
+        """Best matching key within the same scope whose estimated Jaccard >= threshold"""
+        signature = self.signature(text)
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(scope, signature):
+            candidates |= self._buckets.get(band_key, set())
+
+        best_key, best_score = None, threshold
+        for key in candidates:
+            _, other = self._signatures[key]
+            score = sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+class ResponseCache:
+    """Tiered cache for AI chat answers.
+
+    Keys combine the normalized message with the system prompt, a hash of the
+    request context and the model chain. Lookups go memory LRU -> SQLite (if
+    configured) -> near-duplicate MinHash tier (if enabled).
+    """
+
+    def __init__(self):
+        self.memory = LRUCache(settings.ai_cache_max_entries, settings.ai_cache_ttl_seconds)
+        self.disk: Optional[SQLiteCacheStore] = None
+        if settings.ai_cache_sqlite_path:
+            self.disk = SQLiteCacheStore(settings.ai_cache_sqlite_path)
+        self.similar: Optional[MinHashIndex] = None
+        if settings.ai_cache_similarity_enabled:
+            self.similar = MinHashIndex()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "similar_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_keys(message: str, system_prompt: str, context: Optional[dict], model: str) -> Tuple[str, str, str]:
+        """Return (exact key, scope, normalized message)"""
+        normalized = normalize_message(message)
+        context_hash = _digest(json.dumps(context, sort_keys=True, default=str)) if context else ""
+        scope = _digest(system_prompt or "", context_hash, model)
+        return _digest(scope, normalized), scope, normalized
+
+    def _remember(self, key: str, scope: str, normalized: str, response: str, expires_at: Optional[float] = None):
+        for evicted in self.memory.set(key, response, expires_at):
+            if self.similar is not None:
+                self.similar.remove(evicted)
+        if self.similar is not None and similarity_eligible(normalized):
+            self.similar.add(key, scope, normalized)
+
+    async def get(self, message: str, system_prompt: str, context: Optional[dict], model: str) -> Optional[str]:
+        key, scope, normalized = self.make_keys(message, system_prompt, context, model)
+
+        response = self.memory.get(key)
+        if response is not None:
+            self.stats["memory_hits"] += 1
+            return response
+
+        if self.disk is not None:
+            row = await asyncio.to_thread(self.disk.get, key)
+            if row is not None:
+                response, expires_at = row
+                self._remember(key, scope, normalized, response, expires_at)
+                self.stats["disk_hits"] += 1
+                return response
+
+        if self.similar is not None and similarity_eligible(normalized):
+            match = self.similar.query(scope, normalized, settings.ai_cache_similarity_threshold)
+            if match is not None:
+                response = self.memory.get(match)
+                if response is not None:
+                    self.stats["similar_hits"] += 1
+                    return response
+                self.similar.remove(match)  # expired since it was indexed
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, message: str, system_prompt: str, context: Optional[dict], model: str, response: str):
+        key, scope, normalized = self.make_keys(message, system_prompt, context, model)
+        expires_at = time.time() + settings.ai_cache_ttl_seconds
+        self._remember(key, scope, normalized, response, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, response, expires_at)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+response_cache = ResponseCache()
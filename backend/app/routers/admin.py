@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from typing import Optional
+
+from app.config import settings
+from app.profiling import is_admin_token, profile_store
+
+router = APIRouter()
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints exist only when profiling_admin_token is configured"""
+    if not settings.profiling_admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+@router.get("/profiles", dependencies=[Depends(require_admin_token)])
+async def list_profiles():
+    """Slowest profiled requests, slowest first (details at /profiles/{id})"""
+    return {
+        "profiles": [profile.summary() for profile in profile_store.slowest()],
+        "stats": profile_store.stats,
+        "sample_rate": settings.profiling_sample_rate
+    }
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def get_profile(profile_id: int):
+    """One profile with its SQL statements, top functions and call tree"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found (it may have been displaced by slower requests)"
+        )
+    return profile
+
+@router.delete("/profiles", dependencies=[Depends(require_admin_token)])
+async def clear_profiles():
+    profile_store.clear()
+    return {"message": "Profiles cleared successfully"}
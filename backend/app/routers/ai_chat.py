@@ -1,26 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List
 import json
-import openai
-import httpx
-from openai import OpenAI
+import logging
 
-from app.database import get_db
-from app.models import User, ChatMessage
+from app.database import get_async_db
+from app.models import ChatMessage
 from app.schemas import AIChatRequest, AIChatResponse, ChatMessageCreate, ChatMessageResponse
 from app.routers.auth import get_current_user
+from app.auth_cache import UserPrincipal
+from app.ai_providers import get_providers
+from app.ai_routing import dispatch, stream_dispatch
+from app.response_cache import normalize_message, response_cache
+from app.singleflight import SingleFlight
 from app.config import settings
+from app import metrics
+from app import pagination
+from app.serialization import list_serializer, model_columns
+from app.chat_context import conversation_context
+from app.write_behind import chat_writer
+from app.chat_retention import chat_retention
 
 router = APIRouter()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.openai_api_key)
+message_list = list_serializer(ChatMessageResponse)
+logger = logging.getLogger(__name__)
 
-def get_ai_response(message: str, context: dict = None) -> str:
-    """Get AI response using Gemini API with fallbacks"""
-    # Create system prompt for study assistant
-    system_prompt = """You are a helpful study assistant and learning coach. Your role is to:
+# System prompt for the study assistant
+SYSTEM_PROMPT = """You are a helpful study assistant and learning coach. Your role is to:
     1. Provide practical study advice and learning strategies
     2. Help with time management and productivity techniques
     3. Offer motivation and encouragement for academic success
@@ -28,132 +37,116 @@ def get_ai_response(message: str, context: dict = None) -> str:
     5. Keep responses concise but informative (2-3 sentences max)
     
     Focus on actionable advice that students can implement immediately."""
+
+# Identical in-flight prompts share one provider call
+ai_requests = SingleFlight()
+
+# Follow-up suggestions returned with every answer
+FOLLOW_UP_SUGGESTIONS = [
+    "How can I apply this to my current studies?",
+    "Can you give me more specific examples?",
+    "What should I do next?",
+    "How do I stay consistent with this approach?"
+]
+# Sent by many users at once: answered without history unless asked for
+STANDALONE_PROMPTS = {normalize_message(suggestion) for suggestion in FOLLOW_UP_SUGGESTIONS}
+
+def shares_answers(history: List[dict] = None) -> bool:
+    """Whether the answer may come from / go to the response cache and single-flight.
+
+    The history is sent to the provider, so the answer depends on it; keyed on
+    it, the entry would only ever match the same conversation at the same turn.
+    Prompts carrying history therefore bypass both (counted in
+    lockin_ai_cache_bypasses_total); see `wants_history` for which prompts
+    are sent without it.
+    """
+    if history:
+        metrics.ai_cache_bypasses.inc("history")
+        return False
+    return True
+
+async def get_ai_response(message: str, context: dict = None, history: List[dict] = None) -> str:
+    """Get AI response from the configured providers (Gemini, OpenAI, GitHub AI)"""
+    providers = get_providers()
+    model = ",".join(provider.model for provider in providers)
+    shared = shares_answers(history)
+    use_cache = settings.ai_cache_enabled and shared
     
-    # Try Gemini first (primary AI service)
-    if settings.gemini_api:
-        try:
-            return get_gemini_response(message, context, system_prompt)
-        except Exception as e:
-            print(f"Gemini failed: {e}, trying OpenAI...")
+    if use_cache:
+        cached = await response_cache.get(message, SYSTEM_PROMPT, context, model)
+        if cached is not None:
+            return cached
     
-    # Fallback to OpenAI
-    if settings.openai_api_key:
-        try:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ]
-            
-            # Add context if provided
-            if context:
-                context_str = json.dumps(context)
-                messages.insert(1, {"role": "system", "content": f"Context: {context_str}"})
-            
-            response = client.chat.completions.create(
-                model=settings.openai_model,
-                messages=messages,
-                max_tokens=150,
-                temperature=0.7
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"OpenAI failed: {e}, trying GitHub AI...")
+    async def fetch():
+        answer = await dispatch(providers, message, context, SYSTEM_PROMPT, history)
+        if answer and use_cache:
+            await response_cache.set(message, SYSTEM_PROMPT, context, model, answer)
+        return answer
     
-    # Fallback to GitHub AI
-    if settings.github_token:
-        try:
-            return get_github_ai_response_sync(message, context, system_prompt)
-        except Exception as e:
-            print(f"GitHub AI failed: {e}")
+    if settings.ai_singleflight_enabled and shared:
+        key, _, _ = response_cache.make_keys(message, SYSTEM_PROMPT, context, model)
+        response = await ai_requests.do(key, fetch)
+    else:
+        response = await fetch()
+    if response:
+        return response
     
     # Final fallback - return a helpful response
+    metrics.ai_fallbacks.inc()
     return get_fallback_response(message, context)
 
-def get_gemini_response(message: str, context: dict = None, system_prompt: str = None) -> str:
-    """Get AI response using Gemini API via HTTP"""
-    if not settings.gemini_api:
-        raise Exception("Gemini API key not configured")
+async def stream_ai_response(message: str, context: dict = None, history: List[dict] = None) -> AsyncIterator[str]:
+    """Stream an AI response chunk by chunk, with the same cache and fallback as get_ai_response"""
+    providers = get_providers()
+    model = ",".join(provider.model for provider in providers)
+    use_cache = settings.ai_cache_enabled and shares_answers(history)
     
-    try:
-        # Prepare the request payload for Gemini API
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": f"{system_prompt or 'You are a helpful study assistant.'}\n\n"
-                                   f"{'Context: ' + json.dumps(context) + '\n\n' if context else ''}"
-                                   f"User question: {message}"
-                        }
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "maxOutputTokens": 150
-            }
-        }
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        # Use the Gemini API endpoint
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.gemini_model}:generateContent?key={settings.gemini_api}"
-        
-        import requests
-        response = requests.post(url, json=payload, headers=headers, timeout=30.0)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'candidates' in data and len(data['candidates']) > 0:
-                content = data['candidates'][0].get('content', {})
-                parts = content.get('parts', [])
-                if parts and 'text' in parts[0]:
-                    return parts[0]['text'].strip()
-            
-            raise Exception("Unexpected response format from Gemini")
-        else:
-            raise Exception(f"Gemini API error: {response.status_code} - {response.text}")
-            
-    except Exception as e:
-        print(f"Gemini API error: {e}")
-        raise e
-
-def get_github_ai_response_sync(message: str, context: dict = None, system_prompt: str = None) -> str:
-    """Get AI response using GitHub AI API (synchronous version)"""
-    if not settings.github_token:
-        raise Exception("GitHub token not configured")
-    
-    # Prepare the request payload for GitHub AI
-    payload = {
-        "model": settings.github_model,
-        "messages": [
-            {"role": "system", "content": system_prompt or "You are a helpful study assistant."},
-            {"role": "user", "content": message}
-        ],
-        "max_tokens": 150,
-        "temperature": 0.7
-    }
-    
-    headers = {
-        "Authorization": f"Bearer {settings.github_token}",
-        "Content-Type": "application/json"
-    }
-    
-    import requests
-    response = requests.post(
-        settings.github_endpoint,
-        json=payload,
-        headers=headers,
-        timeout=30.0
-    )
+    if use_cache:
+        cached = await response_cache.get(message, SYSTEM_PROMPT, context, model)
+        if cached is not None:
+            yield cached
+            return
     
-    if response.status_code == 200:
-        data = response.json()
-        return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-    else:
-        raise Exception(f"GitHub AI API error: {response.status_code} - {response.text}")
+    chunks = []
+    async for token in stream_dispatch(providers, message, context, SYSTEM_PROMPT, history):
+        chunks.append(token)
+        yield token
+    
+    if chunks:
+        if use_cache:
+            await response_cache.set(message, SYSTEM_PROMPT, context, model, "".join(chunks).strip())
+        return
+    
+    metrics.ai_fallbacks.inc()
+    yield get_fallback_response(message, context)
+
+def wants_history(request: AIChatRequest) -> bool:
+    """request.history if given; otherwise history is sent, except with the canned
+    follow-up suggestions, so identical ones from many users share one answer"""
+    if request.history is not None:
+        return request.history
+    return normalize_message(request.message) not in STANDALONE_PROMPTS
+
+async def build_prompt(db: AsyncSession, user_id: int, request: AIChatRequest):
+    """Recent turns, older-turn summary and trimmed context within the models' token budget"""
+    models = [provider.model for provider in get_providers()]
+    with_history = wants_history(request)
+    if with_history:
+        # The previous exchange may still be queued for writing
+        await chat_writer.wait_for_user(user_id)
+    return await conversation_context.build(
+        db, user_id, request.message, request.context, SYSTEM_PROMPT, models, chat_retention.visible(user_id),
+        with_history
+    )
+
+async def save_chat_exchange(user_id: int, message: str, ai_response: str):
+    """Queue the user's message and the assistant's answer for the batched writer"""
+    await chat_writer.add(user_id, [("user", message), ("assistant", ai_response)])
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Format one Server-Sent Events message"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
 def get_fallback_response(message: str, context: dict = None) -> str:
     """Provide a helpful fallback response when AI services are unavailable"""
@@ -174,43 +167,21 @@ def get_fallback_response(message: str, context: dict = None) -> str:
 @router.post("/chat", response_model=AIChatResponse)
 async def chat_with_ai(
     request: AIChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Chat with AI study companion"""
     try:
-        # Get AI response
-        ai_response = get_ai_response(request.message, request.context)
-        
-        # Save user message
-        user_message = ChatMessage(
-            user_id=current_user.id,
-            content=request.message,
-            role="user"
-        )
-        db.add(user_message)
-        
-        # Save AI response
-        ai_message = ChatMessage(
-            user_id=current_user.id,
-            content=ai_response,
-            role="assistant"
-        )
-        db.add(ai_message)
-        
-        db.commit()
+        # Get AI response, with the conversation so far
+        prompt = await build_prompt(db, current_user.id, request)
+        ai_response = await get_ai_response(prompt.message, prompt.context, prompt.history)
         
-        # Generate follow-up suggestions
-        suggestions = [
-            "How can I apply this to my current studies?",
-            "Can you give me more specific examples?",
-            "What should I do next?",
-            "How do I stay consistent with this approach?"
-        ]
+        # Save user message and AI response
+        await save_chat_exchange(current_user.id, request.message, ai_response)
         
         return AIChatResponse(
             response=ai_response,
-            suggestions=suggestions
+            suggestions=FOLLOW_UP_SUGGESTIONS
         )
         
     except Exception as e:
@@ -219,28 +190,77 @@ async def chat_with_ai(
             detail=f"Failed to get AI response: {str(e)}"
         )
 
+@router.post("/chat/stream")
+async def chat_with_ai_stream(
+    request: AIChatRequest,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Chat with AI study companion, streaming the answer as Server-Sent Events.
+
+    Emits one `data: {"token": ...}` message per chunk, then a `done` event
+    carrying the full response and suggestions once the messages are saved.
+    """
+    user_id = current_user.id
+    prompt = await build_prompt(db, user_id, request)
+    
+    async def event_stream():
+        chunks = []
+        try:
+            async for token in stream_ai_response(prompt.message, prompt.context, prompt.history):
+                chunks.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            logger.warning("AI stream failed: %s", e)
+            yield sse_event({"detail": f"Failed to get AI response: {str(e)}"}, event="error")
+            return
+        
+        ai_response = "".join(chunks).strip()
+        
+        try:
+            await save_chat_exchange(user_id, request.message, ai_response)
+        except Exception as e:
+            logger.warning("Saving streamed chat failed: %s", e)
+            yield sse_event({"detail": f"Failed to save chat: {str(e)}"}, event="error")
+            return
+        
+        yield sse_event({"response": ai_response, "suggestions": FOLLOW_UP_SUGGESTIONS}, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/history", response_model=List[ChatMessageResponse])
 async def get_chat_history(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 50
+    response: Response,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None
 ):
-    """Get user's chat history"""
-    messages = db.query(ChatMessage)\
-        .filter(ChatMessage.user_id == current_user.id)\
-        .order_by(ChatMessage.timestamp.desc())\
-        .limit(limit)\
-        .all()
+    """Get user's chat history, newest first (next page cursor in X-Next-Cursor)"""
+    await chat_writer.wait_for_user(current_user.id)
+    result = await db.execute(
+        pagination.paginate(
+            select(*model_columns(ChatMessage, ChatMessageResponse))
+            .where(ChatMessage.user_id == current_user.id, *chat_retention.visible(current_user.id)),
+            ChatMessage.timestamp, ChatMessage.id, cursor, limit
+        )
+    )
+    messages = pagination.page_rows(result.all(), limit, response, "timestamp")
     
-    return [ChatMessageResponse.from_orm(msg) for msg in messages]
+    return message_list.response(messages, headers=response.headers)
 
 @router.delete("/history")
 async def clear_chat_history(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Clear user's chat history"""
-    db.query(ChatMessage).filter(ChatMessage.user_id == current_user.id).delete()
-    db.commit()
+    """Clear user's chat history (hidden immediately, deleted in chunks in the background)"""
+    # Queued messages would otherwise be inserted after the clear
+    await chat_writer.wait_for_user(current_user.id)
+    await chat_retention.clear_user(db, current_user.id)
     
     return {"message": "Chat history cleared successfully"} 
\ No newline at end of file
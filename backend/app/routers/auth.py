@@ -1,26 +1,42 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from typing import Optional
+from typing import Optional, Tuple
 import json
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.schemas import UserCreate, UserLogin, UserResponse, Token, GoogleOAuthRequest
 from app.config import settings
+from app.queries import PRINCIPAL_COLUMNS
+from app.auth_cache import auth_cache, UserPrincipal
+from app.password_hashing import password_hasher, PasswordHasherBusy
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def hashing_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+async def verify_password(plain_password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Returns (valid, new_hash); new_hash is set when the bcrypt cost has changed"""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise hashing_busy_exception()
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise hashing_busy_exception()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -32,30 +48,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> UserPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        email: str = payload.get("sub")
+        # Decoded-token cache: hot tokens skip signature verification
+        email = auth_cache.decode_subject(token)
         if email is None:
             raise credentials_exception
-        token_data = {"email": email}
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == token_data["email"]).first()
+    # Resolved-user cache: hot users skip the users table lookup
+    principal = auth_cache.get_principal(email)
+    if principal is not None:
+        return principal
+    
+    # Only the principal's columns, not hashed_password / google_id / timestamps
+    result = await db.execute(select(*PRINCIPAL_COLUMNS).where(User.email == email))
+    user = result.first()
     if user is None:
         raise credentials_exception
-    return user
+    return auth_cache.set_principal(user)
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    result = await db.execute(select(User).where(User.email == user_data.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -63,7 +86,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     db_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -71,8 +94,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return UserResponse(
         id=db_user.id,
@@ -82,9 +105,13 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == user_credentials.email).first()
-    if not user or not verify_password(user_credentials.password, user.hashed_password):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.email == user_credentials.email))
+    user = result.scalars().first()
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_password(user_credentials.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -97,6 +124,11 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
             detail="Inactive user"
         )
     
+    # Transparently upgrade hashes made with a different bcrypt cost
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
@@ -105,7 +137,7 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/google-oauth", response_model=Token)
-async def google_oauth(payload: GoogleOAuthRequest, db: Session = Depends(get_db)):
+async def google_oauth(payload: GoogleOAuthRequest, db: AsyncSession = Depends(get_async_db)):
     # This would validate the Google token and create/update user
     # For now, we'll simulate the process
     try:
@@ -113,7 +145,8 @@ async def google_oauth(payload: GoogleOAuthRequest, db: Session = Depends(get_db
         # For demo, we'll create a mock user
         mock_email = "user@google.com"  # This would come from Google token validation
         
-        user = db.query(User).filter(User.email == mock_email).first()
+        result = await db.execute(select(User).where(User.email == mock_email))
+        user = result.scalars().first()
         if not user:
             # Create new user
             user = User(
@@ -122,8 +155,8 @@ async def google_oauth(payload: GoogleOAuthRequest, db: Session = Depends(get_db
                 google_id="google_123"  # This would come from Google
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
         
         # Generate access token
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
@@ -140,7 +173,7 @@ async def google_oauth(payload: GoogleOAuthRequest, db: Session = Depends(get_db
         )
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: UserPrincipal = Depends(get_current_user)):
     return UserResponse(
         id=current_user.id,
         email=current_user.email,
@@ -149,7 +182,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     )
 
 @router.post("/refresh")
-async def refresh_token(current_user: User = Depends(get_current_user)):
+async def refresh_token(current_user: UserPrincipal = Depends(get_current_user)):
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": current_user.email}, expires_delta=access_token_expires
@@ -1,41 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List
 from datetime import datetime, timedelta
+from itertools import islice
 import json
 
-from app.database import get_db
-from app.models import User, StudySession
-from app.schemas import StudySessionCreate, StudySessionResponse
+from app.database import get_async_db
+from app.models import StudyOccurrenceOverride, StudyPlan, StudyRecurrence, StudySession
+from app.schemas import (
+    StudySessionCreate, StudySessionResponse, StudyOccurrenceResponse,
+    StudyRecurrenceCreate, StudyRecurrenceResponse, StudyOccurrenceUpdate, UtcDatetime, naive_utc
+)
 from app.routers.auth import get_current_user
+from app.auth_cache import UserPrincipal
+from app import recurrence, stats_rollup
+from app.serialization import JSONSerializer, list_serializer, model_columns
+from app.queries import SESSION_STATE, count_rows
 
 router = APIRouter()
 
+week_serializer = JSONSerializer(Dict[str, List[StudyOccurrenceResponse]])
+occurrence_list = list_serializer(StudyOccurrenceResponse)
+recurrence_list = list_serializer(StudyRecurrenceResponse)
+
 @router.get("/week")
 async def get_week_schedule(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
     start_date: str = None
 ):
     """Get study sessions for a specific week"""
     try:
         if start_date:
-            start = datetime.fromisoformat(start_date)
+            start = naive_utc(datetime.fromisoformat(start_date))
         else:
             # Start from beginning of current week
-            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
             start = start - timedelta(days=start.weekday())
         
         end = start + timedelta(days=7)
         
-        sessions = db.query(StudySession)\
-            .filter(
+        result = await db.execute(
+            select(*model_columns(StudySession, StudySessionResponse))
+            .where(
                 StudySession.user_id == current_user.id,
                 StudySession.start_time >= start,
                 StudySession.start_time < end
-            )\
-            .order_by(StudySession.start_time)\
-            .all()
+            )
+            .order_by(StudySession.start_time)
+        )
+        sessions = result.all()
+        
+        # Recurring sessions are expanded for this week only
+        rules, overrides = await recurrence.load_window(db, current_user.id, start, end)
+        occurrences = recurrence.expand(rules, overrides, start, end)
         
         # Group sessions by day
         week_schedule = {}
@@ -44,12 +63,13 @@ async def get_week_schedule(
             date_str = date.strftime('%Y-%m-%d')
             week_schedule[date_str] = []
         
-        for session in sessions:
-            date_str = session.start_time.strftime('%Y-%m-%d')
+        for item in recurrence.merge_with_sessions(sessions, occurrences):
+            start_time = item["start_time"] if isinstance(item, dict) else item.start_time
+            date_str = start_time.strftime('%Y-%m-%d')
             if date_str in week_schedule:
-                week_schedule[date_str].append(StudySessionResponse.from_orm(session))
+                week_schedule[date_str].append(item)
         
-        return week_schedule
+        return week_serializer.response(week_schedule)
         
     except Exception as e:
         raise HTTPException(
@@ -59,41 +79,42 @@ async def get_week_schedule(
 
 @router.get("/upcoming")
 async def get_upcoming_sessions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 10
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(10, ge=1, le=500)
 ):
     """Get upcoming study sessions"""
-    now = datetime.now()
+    now = datetime.utcnow()
     
-    sessions = db.query(StudySession)\
-        .filter(
+    result = await db.execute(
+        select(*model_columns(StudySession, StudySessionResponse))
+        .where(
             StudySession.user_id == current_user.id,
             StudySession.start_time >= now
-        )\
-        .order_by(StudySession.start_time)\
-        .limit(limit)\
-        .all()
+        )
+        .order_by(StudySession.start_time)
+        .limit(limit)
+    )
+    sessions = result.all()
     
-    return [StudySessionResponse.from_orm(session) for session in sessions]
+    # Expansion stops as soon as `limit` items have been merged
+    rules, overrides = await recurrence.load_window(db, current_user.id, now)
+    occurrences = recurrence.expand(rules, overrides, now)
+    
+    return occurrence_list.response(list(islice(recurrence.merge_with_sessions(sessions, occurrences), limit)))
 
 @router.post("/sync-google")
 async def sync_with_google_calendar(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Sync study sessions with Google Calendar"""
     try:
         # This would integrate with Google Calendar API
         # For now, we'll simulate the sync process
         
-        # Get user's study sessions
-        sessions = db.query(StudySession)\
-            .filter(StudySession.user_id == current_user.id)\
-            .all()
-        
-        # Simulate Google Calendar sync
-        synced_count = len(sessions)
+        # Simulate Google Calendar sync (only the number of sessions is needed)
+        synced_count = await count_rows(db, StudySession, StudySession.user_id == current_user.id)
         
         return {
             "message": "Calendar synced successfully",
@@ -109,42 +130,31 @@ async def sync_with_google_calendar(
 
 @router.get("/stats")
 async def get_calendar_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
     days: int = 30
 ):
     """Get calendar statistics"""
     try:
-        end_date = datetime.now()
+        end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Get sessions in date range
-        sessions = db.query(StudySession)\
-            .filter(
-                StudySession.user_id == current_user.id,
-                StudySession.start_time >= start_date,
-                StudySession.start_time <= end_date
-            )\
-            .all()
+        # Daily rollups for whole days, raw sessions only for the partial edge days
+        groups = await stats_rollup.summarize_sessions(db, current_user.id, start_date, end_date)
+        await recurrence.summarize_occurrences(db, groups, current_user.id, start_date, end_date)
         
-        # Calculate statistics
-        total_sessions = len(sessions)
-        completed_sessions = len([s for s in sessions if s.completed])
-        total_study_time = sum(s.duration for s in sessions)
-        
-        # Group by session type
+        # Fold the groups into totals and per-type / per-subject breakdowns
+        total_sessions = 0
+        completed_sessions = 0
+        total_study_time = 0
         session_types = {}
-        for session in sessions:
-            if session.session_type not in session_types:
-                session_types[session.session_type] = 0
-            session_types[session.session_type] += 1
-        
-        # Group by subject
         subjects = {}
-        for session in sessions:
-            if session.subject not in subjects:
-                subjects[session.subject] = 0
-            subjects[session.subject] += session.duration
+        for (session_type, subject), (count, completed, minutes) in groups.items():
+            total_sessions += count
+            completed_sessions += completed
+            total_study_time += minutes
+            session_types[session_type] = session_types.get(session_type, 0) + count
+            subjects[subject] = subjects.get(subject, 0) + minutes
         
         return {
             "total_sessions": total_sessions,
@@ -166,13 +176,16 @@ async def get_calendar_stats(
 @router.delete("/sessions/{session_id}")
 async def delete_study_session(
     session_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a study session"""
-    session = db.query(StudySession)\
-        .filter(StudySession.id == session_id, StudySession.user_id == current_user.id)\
-        .first()
+    result = await db.execute(
+        select(StudySession)
+        .options(SESSION_STATE)
+        .where(StudySession.id == session_id, StudySession.user_id == current_user.id)
+    )
+    session = result.scalars().first()
     
     if not session:
         raise HTTPException(
@@ -180,7 +193,166 @@ async def delete_study_session(
             detail="Study session not found"
         )
     
-    db.delete(session)
-    db.commit()
+    await stats_rollup.record_sessions_deleted(db, [session])
+    await db.delete(session)
+    await db.commit()
+    
+    return {"message": "Study session deleted successfully"}
+
+async def get_owned_recurrence(db: AsyncSession, user_id: int, recurrence_id: int) -> StudyRecurrence:
+    result = await db.execute(
+        select(StudyRecurrence)
+        .where(StudyRecurrence.id == recurrence_id, StudyRecurrence.user_id == user_id)
+    )
+    rule = result.scalars().first()
+    
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recurring session not found"
+        )
+    return rule
+
+@router.post("/recurrences", response_model=StudyRecurrenceResponse)
+async def create_recurrence(
+    rule_data: StudyRecurrenceCreate,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a recurring study session (occurrences are generated on read)"""
+    weekdays = sorted(set(rule_data.weekdays or []))
+    if any(day < 0 or day > 6 for day in weekdays):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="weekdays must be between 0 (Monday) and 6 (Sunday)"
+        )
+    if weekdays and rule_data.frequency != "weekly":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="weekdays only apply to weekly recurrences"
+        )
+    
+    if rule_data.study_plan_id is not None:
+        result = await db.execute(
+            select(StudyPlan.id)
+            .where(StudyPlan.id == rule_data.study_plan_id, StudyPlan.user_id == current_user.id)
+        )
+        if result.first() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Study plan not found"
+            )
+    
+    rule = StudyRecurrence(
+        user_id=current_user.id,
+        study_plan_id=rule_data.study_plan_id,
+        subject=rule_data.subject,
+        session_type=rule_data.session_type,
+        frequency=rule_data.frequency,
+        interval=rule_data.interval,
+        by_weekday=",".join(str(day) for day in weekdays) or None,
+        dtstart=rule_data.start_time,
+        duration=rule_data.duration,
+        until=rule_data.until,
+        count=rule_data.count,
+        notes=rule_data.notes
+    )
+    
+    db.add(rule)
+    await db.commit()
+    await db.refresh(rule)
+    
+    return StudyRecurrenceResponse.from_orm(rule)
+
+@router.get("/recurrences", response_model=List[StudyRecurrenceResponse])
+async def get_recurrences(
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get user's recurring study sessions"""
+    result = await db.execute(
+        select(StudyRecurrence)
+        .where(StudyRecurrence.user_id == current_user.id)
+        .order_by(StudyRecurrence.dtstart)
+    )
+    
+    # Whole rows: the response reads the rule's derived weekdays
+    return recurrence_list.response(result.scalars().all())
+
+@router.delete("/recurrences/{recurrence_id}")
+async def delete_recurrence(
+    recurrence_id: int,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete a recurring study session and all of its overrides"""
+    rule = await get_owned_recurrence(db, current_user.id, recurrence_id)
+    
+    await db.execute(delete(StudyOccurrenceOverride).where(StudyOccurrenceOverride.recurrence_id == rule.id))
+    await db.delete(rule)
+    await db.commit()
+    
+    return {"message": "Recurring session deleted successfully"}
+
+async def get_occurrence_override(db: AsyncSession, rule: StudyRecurrence, occurrence_start: datetime) -> StudyOccurrenceOverride:
+    """Existing override for an occurrence, or a new (unsaved) one; 404 if it is not an occurrence"""
+    if not recurrence.is_occurrence(rule, occurrence_start):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Occurrence not found"
+        )
+    
+    result = await db.execute(
+        select(StudyOccurrenceOverride)
+        .where(
+            StudyOccurrenceOverride.recurrence_id == rule.id,
+            StudyOccurrenceOverride.occurrence_start == occurrence_start
+        )
+    )
+    override = result.scalars().first()
+    if override is None:
+        override = StudyOccurrenceOverride(recurrence_id=rule.id, occurrence_start=occurrence_start)
+        db.add(override)
+    return override
+
+@router.put("/recurrences/{recurrence_id}/occurrences/{occurrence_start}", response_model=StudyOccurrenceResponse)
+async def update_occurrence(
+    recurrence_id: int,
+    occurrence_start: UtcDatetime,
+    update_data: StudyOccurrenceUpdate,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Mark one occurrence completed and/or change its notes"""
+    rule = await get_owned_recurrence(db, current_user.id, recurrence_id)
+    override = await get_occurrence_override(db, rule, occurrence_start)
+    
+    if override.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Occurrence not found"
+        )
+    if update_data.completed is not None:
+        override.completed = update_data.completed
+    if update_data.notes is not None:
+        override.notes = update_data.notes
+    
+    await db.commit()
+    
+    return StudyOccurrenceResponse(**recurrence.occurrence_dict(rule, override.occurrence_start, override))
+
+@router.delete("/recurrences/{recurrence_id}/occurrences/{occurrence_start}")
+async def delete_occurrence(
+    recurrence_id: int,
+    occurrence_start: UtcDatetime,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Skip one occurrence of a recurring session"""
+    rule = await get_owned_recurrence(db, current_user.id, recurrence_id)
+    override = await get_occurrence_override(db, rule, occurrence_start)
+    
+    override.is_deleted = True
+    await db.commit()
     
-    return {"message": "Study session deleted successfully"} 
\ No newline at end of file
+    return {"message": "Occurrence deleted successfully"}
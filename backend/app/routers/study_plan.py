@@ -1,40 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-import json
-
-from app.database import get_db
-from app.models import User, StudyPlan, StudySession
-from app.schemas import StudyPlanCreate, StudyPlanResponse, StudySessionCreate, StudySessionResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional
+
+from app.database import get_async_db
+from app.models import PlanTimeSlot, StudyPlan, StudySession
+from app.schemas import (
+    StudyPlanCreate, StudyPlanResponse, StudySessionCreate, StudySessionResponse,
+    StudySessionBulkCreate, StudySessionIdList, StudySessionBulkResult,
+    StudyScheduleRequest, StudyScheduleResponse, TimeSlotSchema
+)
 from app.routers.auth import get_current_user
+from app.auth_cache import UserPrincipal
+from app import pagination, plan_storage, scheduler, stats_rollup
+from app.serialization import list_serializer, model_columns
+from app.queries import SESSION_STATE
 
 router = APIRouter()
 
+session_list = list_serializer(StudySessionResponse)
+
+def session_duration_minutes(session_data: StudySessionCreate) -> int:
+    return int((session_data.end_time - session_data.start_time).total_seconds() / 60)
+
+async def get_owned_sessions(db: AsyncSession, user_id: int, session_ids: List[int]) -> List[StudySession]:
+    """Load the user's sessions by id, or 404 listing any ids that are missing"""
+    result = await db.execute(
+        select(StudySession)
+        .options(SESSION_STATE)
+        .where(StudySession.user_id == user_id, StudySession.id.in_(session_ids))
+    )
+    sessions = result.scalars().all()
+    missing = sorted(set(session_ids) - {session.id for session in sessions})
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Study sessions not found: {missing}"
+        )
+    return sessions
+
 @router.post("/generate", response_model=StudyPlanResponse)
 async def generate_study_plan(
     plan_data: StudyPlanCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate AI-powered study plan"""
     try:
-        # Convert subjects and time slots to JSON strings
-        subjects_json = json.dumps([subject.dict() for subject in plan_data.subjects])
-        time_slots_json = json.dumps([slot.dict() for slot in plan_data.time_slots])
+        plan_subjects, plan_time_slots = plan_storage.build_children(plan_data.subjects, plan_data.time_slots)
         
         # Create study plan
         study_plan = StudyPlan(
             user_id=current_user.id,
             study_method=plan_data.study_method,
-            subjects=subjects_json,
-            time_slots=time_slots_json
+            plan_subjects=plan_subjects,
+            plan_time_slots=plan_time_slots
         )
         
         db.add(study_plan)
-        db.commit()
-        db.refresh(study_plan)
+        await db.commit()
+        await db.refresh(study_plan, ["generated_at"])
         
-        return StudyPlanResponse.from_orm(study_plan)
+        return plan_storage.plan_response(study_plan)
         
     except Exception as e:
         raise HTTPException(
@@ -44,14 +72,18 @@ async def generate_study_plan(
 
 @router.get("/current", response_model=StudyPlanResponse)
 async def get_current_study_plan(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's current study plan"""
-    study_plan = db.query(StudyPlan)\
-        .filter(StudyPlan.user_id == current_user.id)\
-        .order_by(StudyPlan.generated_at.desc())\
-        .first()
+    result = await db.execute(
+        select(StudyPlan)
+        .options(*plan_storage.PLAN_CHILDREN)
+        .where(StudyPlan.user_id == current_user.id)
+        .order_by(StudyPlan.generated_at.desc(), StudyPlan.id.desc())
+        .limit(1)
+    )
+    study_plan = result.scalars().first()
     
     if not study_plan:
         raise HTTPException(
@@ -59,31 +91,152 @@ async def get_current_study_plan(
             detail="No study plan found"
         )
     
-    return StudyPlanResponse.from_orm(study_plan)
+    return plan_storage.plan_response(study_plan)
+
+@router.get("/current/time-slots", response_model=List[TimeSlotSchema])
+async def get_current_time_slots(
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    day: Optional[str] = None,
+    available: Optional[bool] = None
+):
+    """Get the current plan's time slots, optionally for one weekday and availability"""
+    latest_plan_id = (
+        select(StudyPlan.id)
+        .where(StudyPlan.user_id == current_user.id)
+        .order_by(StudyPlan.generated_at.desc(), StudyPlan.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    conditions = [PlanTimeSlot.study_plan_id == latest_plan_id]
+    if day is not None:
+        weekday = plan_storage.weekday_number(day)
+        if weekday is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid day '{day}'"
+            )
+        conditions.append(PlanTimeSlot.weekday == weekday)
+    if available is not None:
+        conditions.append(PlanTimeSlot.is_available.is_(available))
+    
+    result = await db.execute(
+        select(PlanTimeSlot.day, PlanTimeSlot.start_time, PlanTimeSlot.end_time, PlanTimeSlot.is_available)
+        .where(*conditions)
+        .order_by(PlanTimeSlot.weekday, PlanTimeSlot.start_minute, PlanTimeSlot.position)
+    )
+    
+    return [TimeSlotSchema(**row._mapping) for row in result.all()]
 
 @router.get("/history", response_model=List[StudyPlanResponse])
 async def get_study_plan_history(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None
 ):
-    """Get user's study plan history"""
-    study_plans = db.query(StudyPlan)\
-        .filter(StudyPlan.user_id == current_user.id)\
-        .order_by(StudyPlan.generated_at.desc())\
-        .all()
+    """Get user's study plan history, newest first (next page cursor in X-Next-Cursor)"""
+    result = await db.execute(
+        pagination.paginate(
+            select(StudyPlan).options(*plan_storage.PLAN_CHILDREN).where(StudyPlan.user_id == current_user.id),
+            StudyPlan.generated_at, StudyPlan.id, cursor, limit
+        )
+    )
+    study_plans = pagination.page_rows(result.scalars().all(), limit, response, "generated_at")
     
-    return [StudyPlanResponse.from_orm(plan) for plan in study_plans]
+    return [plan_storage.plan_response(plan) for plan in study_plans]
+
+@router.post("/{plan_id}/schedule", response_model=StudyScheduleResponse)
+async def schedule_study_plan(
+    plan_id: int,
+    schedule_request: StudyScheduleRequest,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Materialize a plan's weekly time slots into study sessions for N weeks"""
+    result = await db.execute(
+        select(StudyPlan)
+        .options(*plan_storage.PLAN_CHILDREN)
+        .where(StudyPlan.id == plan_id, StudyPlan.user_id == current_user.id)
+    )
+    study_plan = result.scalars().first()
+    
+    if not study_plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Study plan not found"
+        )
+    
+    try:
+        schedule = scheduler.build_weekly_schedule(
+            study_plan.study_method,
+            plan_storage.plan_subjects(study_plan),
+            plan_storage.plan_time_slots(study_plan)
+        )
+    except scheduler.ScheduleError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    now = datetime.utcnow()
+    start_date = schedule_request.start_date or now.date()
+    rows = scheduler.expand_weeks(
+        schedule, start_date, schedule_request.weeks, current_user.id, study_plan.id, not_before=now
+    )
+    
+    try:
+        replaced = []
+        if schedule_request.replace_existing:
+            result = await db.execute(
+                select(StudySession)
+                .options(SESSION_STATE)
+                .where(
+                    StudySession.study_plan_id == study_plan.id,
+                    StudySession.completed.is_(False),
+                    StudySession.start_time >= max(now, datetime.combine(start_date, datetime.min.time()))
+                )
+            )
+            replaced = result.scalars().all()
+            if replaced:
+                await stats_rollup.record_sessions_deleted(db, replaced)
+                await db.execute(
+                    delete(StudySession)
+                    .where(StudySession.id.in_([session.id for session in replaced]))
+                    .execution_options(synchronize_session=False)
+                )
+        
+        if rows:
+            result = await db.execute(insert(StudySession).returning(StudySession), rows)
+            await stats_rollup.record_sessions_created(db, result.scalars().all())
+        await db.commit()
+        
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to schedule study plan: {str(e)}"
+        )
+    
+    return StudyScheduleResponse(
+        study_plan_id=study_plan.id,
+        weeks=schedule_request.weeks,
+        sessions_created=len(rows),
+        sessions_replaced=len(replaced),
+        focus_minutes=schedule.focus_minutes,
+        break_minutes=schedule.break_minutes,
+        requested_blocks=schedule.requested_blocks,
+        allocated_blocks=schedule.allocated_blocks
+    )
 
 @router.post("/sessions", response_model=StudySessionResponse)
 async def create_study_session(
     session_data: StudySessionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new study session"""
     try:
         # Calculate duration in minutes
-        duration = int((session_data.end_time - session_data.start_time).total_seconds() / 60)
+        duration = session_duration_minutes(session_data)
         
         study_session = StudySession(
             user_id=current_user.id,
@@ -96,8 +249,9 @@ async def create_study_session(
         )
         
         db.add(study_session)
-        db.commit()
-        db.refresh(study_session)
+        await stats_rollup.record_sessions_created(db, [study_session])
+        await db.commit()
+        await db.refresh(study_session)
         
         return StudySessionResponse.from_orm(study_session)
         
@@ -107,31 +261,126 @@ async def create_study_session(
             detail=f"Failed to create study session: {str(e)}"
         )
 
+@router.post("/sessions/bulk", response_model=List[StudySessionResponse])
+async def create_study_sessions_bulk(
+    bulk_data: StudySessionBulkCreate,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create many study sessions in a single transaction (e.g. a semester import)"""
+    # Validate everything before writing anything
+    errors = [
+        {"index": index, "error": "end_time must be after start_time"}
+        for index, session_data in enumerate(bulk_data.sessions)
+        if session_data.end_time <= session_data.start_time
+    ]
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+    
+    rows = [
+        {
+            "user_id": current_user.id,
+            "subject": session_data.subject,
+            "start_time": session_data.start_time,
+            "end_time": session_data.end_time,
+            "duration": session_duration_minutes(session_data),
+            "session_type": session_data.session_type,
+            "notes": session_data.notes,
+            "completed": False
+        }
+        for session_data in bulk_data.sessions
+    ]
+    
+    try:
+        # One executemany-style INSERT ... RETURNING: no refresh per row
+        result = await db.execute(insert(StudySession).returning(StudySession), rows)
+        sessions = result.scalars().all()
+        await stats_rollup.record_sessions_created(db, sessions)
+        await db.commit()
+        
+        return session_list.response(sessions)
+        
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create study sessions: {str(e)}"
+        )
+
+@router.put("/sessions/bulk/complete", response_model=StudySessionBulkResult)
+async def mark_sessions_complete_bulk(
+    id_list: StudySessionIdList,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Mark many study sessions as completed in one transaction"""
+    sessions = await get_owned_sessions(db, current_user.id, id_list.session_ids)
+    newly_completed = [session for session in sessions if not session.completed]
+    
+    if newly_completed:
+        await db.execute(
+            update(StudySession)
+            .where(StudySession.id.in_([session.id for session in newly_completed]))
+            .values(completed=True)
+            .execution_options(synchronize_session=False)
+        )
+        await stats_rollup.record_sessions_completed(db, newly_completed)
+        await db.commit()
+    
+    return StudySessionBulkResult(message="Sessions marked as completed", count=len(newly_completed))
+
+@router.post("/sessions/bulk/delete", response_model=StudySessionBulkResult)
+async def delete_study_sessions_bulk(
+    id_list: StudySessionIdList,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete many study sessions in one transaction"""
+    sessions = await get_owned_sessions(db, current_user.id, id_list.session_ids)
+    
+    await stats_rollup.record_sessions_deleted(db, sessions)
+    await db.execute(
+        delete(StudySession)
+        .where(StudySession.id.in_([session.id for session in sessions]))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    
+    return StudySessionBulkResult(message="Study sessions deleted successfully", count=len(sessions))
+
 @router.get("/sessions", response_model=List[StudySessionResponse])
 async def get_study_sessions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 100
+    response: Response,
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str = None
 ):
-    """Get user's study sessions"""
-    sessions = db.query(StudySession)\
-        .filter(StudySession.user_id == current_user.id)\
-        .order_by(StudySession.start_time.desc())\
-        .limit(limit)\
-        .all()
+    """Get user's study sessions, latest start first (next page cursor in X-Next-Cursor)"""
+    result = await db.execute(
+        pagination.paginate(
+            select(*model_columns(StudySession, StudySessionResponse))
+            .where(StudySession.user_id == current_user.id),
+            StudySession.start_time, StudySession.id, cursor, limit
+        )
+    )
+    sessions = pagination.page_rows(result.all(), limit, response, "start_time")
     
-    return [StudySessionResponse.from_orm(session) for session in sessions]
+    return session_list.response(sessions, headers=response.headers)
 
 @router.put("/sessions/{session_id}/complete")
 async def mark_session_complete(
     session_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark a study session as completed"""
-    session = db.query(StudySession)\
-        .filter(StudySession.id == session_id, StudySession.user_id == current_user.id)\
-        .first()
+    result = await db.execute(
+        select(StudySession)
+        .options(SESSION_STATE)
+        .where(StudySession.id == session_id, StudySession.user_id == current_user.id)
+    )
+    session = result.scalars().first()
     
     if not session:
         raise HTTPException(
@@ -139,7 +388,9 @@ async def mark_session_complete(
             detail="Study session not found"
         )
     
-    session.completed = True
-    db.commit()
+    if not session.completed:
+        session.completed = True
+        await stats_rollup.record_sessions_completed(db, [session])
+        await db.commit()
     
     return {"message": "Session marked as completed"} 
\ No newline at end of file
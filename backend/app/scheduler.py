@@ -0,0 +1,215 @@
+"""Turns a study plan's weekly availability into concrete study sessions.
+
+1. Available time slots are parsed and merged per weekday (sort + sweep), so
+   overlapping or touching slots become one free interval.
+2. Each free interval is packed greedily with method-sized blocks
+   (pomodoro: 25 min focus + 5 min break, ...). A break is only needed
+   between two blocks, never after the last block of an interval.
+3. Subjects ask for ceil(hours_per_week * 60 / block) blocks. If the week has
+   fewer blocks than requested, demand is scaled down by priority weight
+   (largest remainder), so high priority subjects keep the most time.
+4. With spare capacity, an evenly spaced subset of blocks is used. Blocks
+   are then handed out in chronological order to the subject with the
+   largest share of its demand still unserved (a heap), which spreads every
+   subject evenly across the week instead of stacking it on one day.
+   Ties go to higher priority, then harder subjects.
+
+Everything is O((slots + blocks) log(slots + subjects)) per week; the weekly
+template is computed once and then repeated for N weeks.
+"""
+import heapq
+import math
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.schemas import SubjectSchema, TimeSlotSchema
+
+# study method -> (focus minutes, break minutes)
+STUDY_METHOD_BLOCKS: Dict[str, Tuple[int, int]] = {
+    "pomodoro": (25, 5),
+    "active-recall": (45, 10),
+    "spaced-repetition": (30, 10),
+    "feynman": (40, 10),
+    "interleaving": (30, 5),
+}
+DEFAULT_BLOCK = (25, 5)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+PRIORITY_WEIGHTS = {"high": 3, "medium": 2, "low": 1}
+DIFFICULTY_WEIGHTS = {"hard": 3, "medium": 2, "easy": 1}
+
+class ScheduleError(ValueError):
+    """Raised when a plan's time slots cannot be interpreted"""
+
+class Block(NamedTuple):
+    weekday: int  # 0 = Monday
+    start: int  # minutes from midnight
+    end: int
+    subject: str
+
+@dataclass(frozen=True)
+class WeeklySchedule:
+    study_method: str
+    focus_minutes: int
+    break_minutes: int
+    blocks: List[Block]
+    requested_blocks: Dict[str, int]
+    allocated_blocks: Dict[str, int]
+
+def parse_clock(value: str) -> int:
+    """'HH:MM' -> minutes from midnight ('24:00' is allowed as end of day)"""
+    try:
+        hours, minutes = value.strip().split(":")[:2]
+        total = int(hours) * 60 + int(minutes)
+    except ValueError:
+        raise ScheduleError(f"Invalid time '{value}', expected HH:MM")
+    if not 0 <= total <= 24 * 60:
+        raise ScheduleError(f"Invalid time '{value}', expected HH:MM")
+    return total
+
+def free_intervals(time_slots: Iterable[TimeSlotSchema]) -> List[Tuple[int, int, int]]:
+    """Merged (weekday, start, end) intervals of the available slots, in week order"""
+    raw = []
+    for slot in time_slots:
+        if not slot.is_available:
+            continue
+        day = slot.day.strip().lower()
+        if day not in WEEKDAYS:
+            raise ScheduleError(f"Invalid day '{slot.day}'")
+        start, end = parse_clock(slot.start_time), parse_clock(slot.end_time)
+        if end > start:
+            raw.append((WEEKDAYS.index(day), start, end))
+    raw.sort()
+
+    merged: List[Tuple[int, int, int]] = []
+    for weekday, start, end in raw:
+        if merged and merged[-1][0] == weekday and start <= merged[-1][2]:
+            last = merged[-1]
+            merged[-1] = (weekday, last[1], max(last[2], end))
+        else:
+            merged.append((weekday, start, end))
+    return merged
+
+def pack_blocks(intervals: List[Tuple[int, int, int]], focus: int, rest: int) -> List[Tuple[int, int, int]]:
+    """Greedily fill each interval with focus-length blocks separated by breaks"""
+    blocks = []
+    step = focus + rest
+    for weekday, start, end in intervals:
+        # n blocks need n * focus + (n - 1) * rest minutes
+        for i in range((end - start + rest) // step):
+            block_start = start + i * step
+            blocks.append((weekday, block_start, block_start + focus))
+    return blocks
+
+def requested_blocks(subjects: List[SubjectSchema], focus: int) -> Dict[str, int]:
+    demand: Dict[str, int] = {}
+    for subject in subjects:
+        if subject.hours_per_week > 0:
+            blocks = math.ceil(subject.hours_per_week * 60 / focus)
+            demand[subject.name] = demand.get(subject.name, 0) + blocks
+    return demand
+
+def scale_to_capacity(demand: Dict[str, int], weights: Dict[str, int], capacity: int) -> Dict[str, int]:
+    """Shrink demand to fit capacity, proportionally to demand * priority weight"""
+    total = sum(demand.values())
+    if total <= capacity:
+        return dict(demand)
+
+    weighted = {name: blocks * weights[name] for name, blocks in demand.items()}
+    weighted_total = sum(weighted.values())
+    shares = {name: capacity * value / weighted_total for name, value in weighted.items()}
+    allocation = {name: min(demand[name], int(share)) for name, share in shares.items()}
+
+    # Hand out the blocks lost to rounding by largest remainder
+    remaining = capacity - sum(allocation.values())
+    by_remainder = sorted(shares, key=lambda name: (shares[name] - int(shares[name]), weights[name]), reverse=True)
+    while remaining > 0:
+        progressed = False
+        for name in by_remainder:
+            if remaining and allocation[name] < demand[name]:
+                allocation[name] += 1
+                remaining -= 1
+                progressed = True
+        if not progressed:
+            break
+    return allocation
+
+def build_weekly_schedule(study_method: str, subjects: List[SubjectSchema],
+                          time_slots: List[TimeSlotSchema]) -> WeeklySchedule:
+    """Allocate one week of blocks to subjects"""
+    focus, rest = STUDY_METHOD_BLOCKS.get(study_method, DEFAULT_BLOCK)
+    slots = pack_blocks(free_intervals(time_slots), focus, rest)
+    demand = requested_blocks(subjects, focus)
+
+    weights: Dict[str, int] = {}
+    difficulty: Dict[str, int] = {}
+    for subject in subjects:
+        weights[subject.name] = max(weights.get(subject.name, 0), PRIORITY_WEIGHTS.get(subject.priority.lower(), 2))
+        difficulty[subject.name] = max(difficulty.get(subject.name, 0), DIFFICULTY_WEIGHTS.get(subject.difficulty.lower(), 2))
+
+    allocation = scale_to_capacity(demand, weights, len(slots))
+    used = sum(allocation.values())
+    if used < len(slots):
+        # Spare capacity: use evenly spaced blocks rather than front-loading the week
+        slots = [slots[i * len(slots) // used] for i in range(used)]
+
+    # Max-heap on the unserved fraction of each subject's allocation
+    heap = [(-1.0, -weights[name], -difficulty[name], name) for name, blocks in allocation.items() if blocks]
+    heapq.heapify(heap)
+    left = dict(allocation)
+
+    blocks: List[Block] = []
+    for weekday, start, end in slots:
+        if not heap:
+            break
+        _, neg_weight, neg_difficulty, name = heapq.heappop(heap)
+        blocks.append(Block(weekday, start, end, name))
+        left[name] -= 1
+        if left[name]:
+            heapq.heappush(heap, (-left[name] / allocation[name], neg_weight, neg_difficulty, name))
+
+    return WeeklySchedule(
+        study_method=study_method,
+        focus_minutes=focus,
+        break_minutes=rest,
+        blocks=blocks,
+        requested_blocks=demand,
+        allocated_blocks=allocation
+    )
+
+def week_start(day: date) -> date:
+    """Monday of the week containing `day`"""
+    return day - timedelta(days=day.weekday())
+
+def expand_weeks(schedule: WeeklySchedule, start_date: date, weeks: int, user_id: int,
+                 study_plan_id: int, not_before: Optional[datetime] = None) -> List[dict]:
+    """StudySession rows for `weeks` weeks from the week of `start_date`.
+
+    Blocks before `start_date` (or `not_before`) in the first week are skipped.
+    """
+    first_monday = datetime.combine(week_start(start_date), datetime.min.time())
+    cutoff = max(datetime.combine(start_date, datetime.min.time()), not_before or datetime.min)
+    # Offsets from Monday 00:00 are computed once and reused for every week
+    offsets = [
+        (timedelta(days=block.weekday, minutes=block.start), timedelta(minutes=block.end - block.start), block)
+        for block in schedule.blocks
+    ]
+    rows = []
+    for week in range(weeks):
+        monday = first_monday + timedelta(weeks=week)
+        for start_offset, length, block in offsets:
+            start_time = monday + start_offset
+            if start_time < cutoff:
+                continue
+            rows.append({
+                "user_id": user_id,
+                "study_plan_id": study_plan_id,
+                "subject": block.subject,
+                "start_time": start_time,
+                "end_time": start_time + length,
+                "duration": block.end - block.start,
+                "session_type": "focus",
+                "completed": False
+            })
+    return rows
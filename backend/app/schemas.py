@@ -1,6 +1,16 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from pydantic import AfterValidator, BaseModel, EmailStr, Field
+from typing import Annotated, Optional, List, Dict, Any
+from datetime import date, datetime, timezone
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Datetimes are stored and compared naive in UTC (the clock of server_default=func.now());
+    aware input (e.g. "...+02:00", "...Z") is converted, naive input is taken as UTC already"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+# Datetime input, normalized to naive UTC
+UtcDatetime = Annotated[datetime, AfterValidator(naive_utc)]
 
 # User schemas
 class UserBase(BaseModel):
@@ -58,14 +68,39 @@ class StudyPlanResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class StudyScheduleRequest(BaseModel):
+    weeks: int = Field(4, ge=1, le=26)
+    start_date: Optional[date] = None  # defaults to today
+    replace_existing: bool = True  # drop the plan's future, not yet completed sessions first
+
+class StudyScheduleResponse(BaseModel):
+    study_plan_id: int
+    weeks: int
+    sessions_created: int
+    sessions_replaced: int
+    focus_minutes: int
+    break_minutes: int
+    requested_blocks: Dict[str, int]  # per subject and week
+    allocated_blocks: Dict[str, int]
+
 # Study Session schemas
 class StudySessionCreate(BaseModel):
     subject: str
-    start_time: datetime
-    end_time: datetime
+    start_time: UtcDatetime
+    end_time: UtcDatetime
     session_type: str
     notes: Optional[str] = None
 
+class StudySessionBulkCreate(BaseModel):
+    sessions: List[StudySessionCreate] = Field(..., min_length=1, max_length=1000)
+
+class StudySessionIdList(BaseModel):
+    session_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class StudySessionBulkResult(BaseModel):
+    message: str
+    count: int
+
 class StudySessionResponse(BaseModel):
     id: int
     user_id: int
@@ -82,6 +117,48 @@ class StudySessionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class StudyOccurrenceResponse(StudySessionResponse):
+    """A concrete session (recurrence_id is None) or an expanded recurring occurrence (id is None)"""
+    id: Optional[int] = None
+    recurrence_id: Optional[int] = None
+
+# Recurring session schemas
+class StudyRecurrenceCreate(BaseModel):
+    subject: str
+    session_type: str = "focus"
+    study_plan_id: Optional[int] = None
+    frequency: str = Field("weekly", pattern="^(daily|weekly)$")
+    interval: int = Field(1, ge=1, le=52)
+    weekdays: Optional[List[int]] = None  # 0 = Monday; weekly only, defaults to start_time's weekday
+    start_time: UtcDatetime  # first occurrence
+    duration: int = Field(..., gt=0, le=24 * 60)  # in minutes
+    until: Optional[UtcDatetime] = None
+    count: Optional[int] = Field(None, ge=1)
+    notes: Optional[str] = None
+
+class StudyRecurrenceResponse(BaseModel):
+    id: int
+    user_id: int
+    study_plan_id: Optional[int] = None
+    subject: str
+    session_type: str
+    frequency: str
+    interval: int
+    weekdays: List[int]
+    start_time: datetime = Field(validation_alias="dtstart")
+    duration: int
+    until: Optional[datetime] = None
+    count: Optional[int] = None
+    notes: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class StudyOccurrenceUpdate(BaseModel):
+    completed: Optional[bool] = None
+    notes: Optional[str] = None
+
 # Chat schemas
 class ChatMessageCreate(BaseModel):
     content: str
@@ -101,6 +178,9 @@ class ChatMessageResponse(BaseModel):
 class AIChatRequest(BaseModel):
     message: str
     context: Optional[Dict[str, Any]] = None
+    # Send the conversation so far with the message. Default: yes, except for the
+    # canned follow-up suggestions, which are answered standalone (cacheable)
+    history: Optional[bool] = None
 
 class AIChatResponse(BaseModel):
     response: str
@@ -0,0 +1,35 @@
+"""Fast JSON rendering for list endpoints.
+
+The default path builds one pydantic model per ORM row (`from_orm`), then
+FastAPI validates every item again against `response_model`, converts it
+to Python primitives with `jsonable_encoder` and finally `json.dumps` it.
+Here the rows come from a column-only select and a TypeAdapter validates
+and dumps the whole list to JSON bytes in pydantic-core in one step. The
+returned Response bypasses FastAPI's second pass; `response_model` on the
+route is kept for the OpenAPI schema. The JSON produced is identical.
+"""
+from typing import Any, List, Mapping, Optional, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+def model_columns(model, schema: Type[BaseModel]) -> list:
+    """The model's columns backing the schema's fields, for column-only selects"""
+    table_columns = model.__table__.columns
+    return [getattr(model, name) for name in schema.model_fields if name in table_columns]
+
+class JSONSerializer:
+    """Validates and dumps a whole response (e.g. List[Schema]) in one call"""
+
+    def __init__(self, response_type: Any):
+        self.adapter = TypeAdapter(response_type)
+
+    def dump(self, content: Any) -> bytes:
+        # from_attributes: accepts ORM objects and Row objects as well as dicts
+        return self.adapter.dump_json(self.adapter.validate_python(content, from_attributes=True))
+
+    def response(self, content: Any, headers: Optional[Mapping[str, str]] = None) -> Response:
+        return Response(content=self.dump(content), media_type="application/json", headers=headers)
+
+def list_serializer(schema: Type[BaseModel]) -> JSONSerializer:
+    return JSONSerializer(List[schema])
@@ -0,0 +1,186 @@
+"""Incrementally maintained daily study statistics.
+
+Every change to study_sessions that affects /calendar/stats is mirrored as a
+delta on the matching study_stats_daily row, inside the same transaction as
+the change itself. Stats over long windows then read one row per day and
+group instead of rescanning raw sessions.
+
+Rebuild from scratch (e.g. after manual edits to the database):
+
+    python -m app.stats_rollup rebuild [--user-id ID]
+"""
+import sys
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import StudySession, StudyStatsDaily
+
+# (session_type, subject) -> [session_count, completed_count, total_minutes]
+StatsGroups = Dict[Tuple[str, str], List[int]]
+
+def _upsert(dialect_name: str):
+    return postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+
+async def apply_delta(db: AsyncSession, user_id: int, day: date, subject: str, session_type: str,
+                      sessions: int = 0, completed: int = 0, minutes: int = 0):
+    """Add a delta to one rollup row, creating it if needed (caller commits)"""
+    statement = _upsert(db.bind.dialect.name)(StudyStatsDaily).values(
+        user_id=user_id,
+        day=day,
+        subject=subject,
+        session_type=session_type,
+        session_count=sessions,
+        completed_count=completed,
+        total_minutes=minutes
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "day", "subject", "session_type"],
+        set_={
+            "session_count": StudyStatsDaily.session_count + statement.excluded.session_count,
+            "completed_count": StudyStatsDaily.completed_count + statement.excluded.completed_count,
+            "total_minutes": StudyStatsDaily.total_minutes + statement.excluded.total_minutes
+        }
+    )
+    await db.execute(statement)
+
+async def _apply_grouped(db: AsyncSession, sessions: Iterable, delta):
+    """Sum per-session deltas by rollup row, then apply one upsert per row"""
+    pending: Dict[tuple, List[int]] = {}
+    for session in sessions:
+        key = (session.user_id, session.start_time.date(), session.subject, session.session_type)
+        totals = pending.setdefault(key, [0, 0, 0])
+        for i, value in enumerate(delta(session)):
+            totals[i] += value
+    for (user_id, day, subject, session_type), (count, completed, minutes) in pending.items():
+        await apply_delta(
+            db, user_id, day, subject, session_type,
+            sessions=count, completed=completed, minutes=minutes
+        )
+
+async def record_sessions_created(db: AsyncSession, sessions: Iterable[StudySession]):
+    await _apply_grouped(db, sessions, lambda s: (1, 1 if s.completed else 0, s.duration))
+
+async def record_sessions_completed(db: AsyncSession, sessions: Iterable[StudySession]):
+    """Call for sessions that flip from not completed to completed"""
+    await _apply_grouped(db, sessions, lambda s: (0, 1, 0))
+
+async def record_sessions_deleted(db: AsyncSession, sessions: Iterable[StudySession]):
+    await _apply_grouped(db, sessions, lambda s: (-1, -1 if s.completed else 0, -s.duration))
+
+def _merge(groups: StatsGroups, rows):
+    for session_type, subject, count, completed, minutes in rows:
+        totals = groups.setdefault((session_type, subject), [0, 0, 0])
+        totals[0] += count or 0
+        totals[1] += completed or 0
+        totals[2] += minutes or 0
+
+async def _raw_groups(db: AsyncSession, groups: StatsGroups, user_id: int, start: datetime, end: datetime,
+                      include_end: bool):
+    end_condition = StudySession.start_time <= end if include_end else StudySession.start_time < end
+    result = await db.execute(
+        select(
+            StudySession.session_type,
+            StudySession.subject,
+            func.count(StudySession.id),
+            func.sum(case((StudySession.completed.is_(True), 1), else_=0)),
+            func.sum(StudySession.duration)
+        )
+        .where(
+            StudySession.user_id == user_id,
+            StudySession.start_time >= start,
+            end_condition
+        )
+        .group_by(StudySession.session_type, StudySession.subject)
+    )
+    _merge(groups, result.all())
+
+async def summarize_sessions(db: AsyncSession, user_id: int, start: datetime, end: datetime) -> StatsGroups:
+    """Per (session_type, subject) totals for sessions starting in [start, end].
+
+    Whole days inside the window come from the rollup table; the partial days
+    at either edge are aggregated from raw sessions so the result is exact.
+    """
+    groups: StatsGroups = {}
+    first_full_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    last_full_day = end.date() - timedelta(days=1)
+
+    if first_full_day > last_full_day:
+        await _raw_groups(db, groups, user_id, start, end, include_end=True)
+        return groups
+
+    result = await db.execute(
+        select(
+            StudyStatsDaily.session_type,
+            StudyStatsDaily.subject,
+            func.sum(StudyStatsDaily.session_count),
+            func.sum(StudyStatsDaily.completed_count),
+            func.sum(StudyStatsDaily.total_minutes)
+        )
+        .where(
+            StudyStatsDaily.user_id == user_id,
+            StudyStatsDaily.day >= first_full_day,
+            StudyStatsDaily.day <= last_full_day
+        )
+        .group_by(StudyStatsDaily.session_type, StudyStatsDaily.subject)
+    )
+    _merge(groups, result.all())
+
+    head_end = datetime.combine(first_full_day, time.min)
+    if start < head_end:
+        await _raw_groups(db, groups, user_id, start, head_end, include_end=False)
+    await _raw_groups(db, groups, user_id, datetime.combine(end.date(), time.min), end, include_end=True)
+
+    # Groups whose sessions were all deleted linger as zero rows
+    return {key: totals for key, totals in groups.items() if totals[0]}
+
+def rebuild(connection, user_id: Optional[int] = None) -> int:
+    """Recompute rollup rows from study_sessions (sync connection, caller commits)"""
+    condition = [StudyStatsDaily.user_id == user_id] if user_id is not None else []
+    connection.execute(delete(StudyStatsDaily).where(*condition))
+
+    source = select(
+        StudySession.user_id,
+        func.date(StudySession.start_time),
+        StudySession.subject,
+        StudySession.session_type,
+        func.count(StudySession.id),
+        func.sum(case((StudySession.completed.is_(True), 1), else_=0)),
+        func.coalesce(func.sum(StudySession.duration), 0)
+    )
+    if user_id is not None:
+        source = source.where(StudySession.user_id == user_id)
+    source = source.group_by(
+        StudySession.user_id,
+        func.date(StudySession.start_time),
+        StudySession.subject,
+        StudySession.session_type
+    )
+
+    result = connection.execute(
+        insert(StudyStatsDaily).from_select(
+            ["user_id", "day", "subject", "session_type", "session_count", "completed_count", "total_minutes"],
+            source
+        )
+    )
+    return result.rowcount
+
+def main(argv: List[str]):
+    from app.database import engine, Base
+
+    if not argv or argv[0] != "rebuild":
+        print("Usage: python -m app.stats_rollup rebuild [--user-id ID]")
+        sys.exit(1)
+    user_id = int(argv[argv.index("--user-id") + 1]) if "--user-id" in argv else None
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        rows = rebuild(connection, user_id)
+    print(f"✅ Rebuilt {rows} study stats rollup rows")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
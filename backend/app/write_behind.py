@@ -0,0 +1,145 @@
+"""Write-behind persistence for chat messages.
+
+Requests enqueue their messages and return; a background task drains the
+queue and inserts everything that arrived within `chat_write_interval_ms`
+(or up to `chat_write_batch_size` messages) in one transaction, so a burst
+of chats costs one commit instead of one per request.
+
+Messages are timestamped when enqueued, so ordering is the same as with a
+direct insert. Readers that must see a user's latest messages (history,
+conversation context, clearing) call `wait_for_user` first. The queue is
+drained on shutdown. With chat_persistence_mode = "durable" the request
+waits for its batch to commit (group commit) and fails if it does not.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Queue item: the rows of one request and a future resolved once they are committed
+Batch = List[Tuple[List[dict], asyncio.Future]]
+
+class ChatPersistenceError(Exception):
+    """Raised to durable callers when their batch could not be committed"""
+
+class ChatMessageWriter:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Future of each user's most recently enqueued messages
+        self._last_by_user: Dict[int, asyncio.Future] = {}
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=settings.chat_write_queue_max)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything still queued, then stop the background task"""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def add(self, user_id: int, messages: List[Tuple[str, str]]):
+        """Queue (role, content) messages for a user; waits for the commit in durable mode"""
+        self.start()
+        timestamp = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "role": role, "content": content, "timestamp": timestamp}
+            for role, content in messages
+        ]
+        future = asyncio.get_running_loop().create_future()
+        self._last_by_user[user_id] = future
+        await self._queue.put((rows, future))
+        self.stats["enqueued"] += len(rows)
+
+        if settings.chat_persistence_mode == "durable":
+            error = await asyncio.shield(future)
+            if error is not None:
+                raise ChatPersistenceError(f"Failed to save chat messages: {error}")
+
+    async def wait_for_user(self, user_id: int):
+        """Block until the user's queued messages are committed (read-your-writes)"""
+        future = self._last_by_user.get(user_id)
+        if future is not None:
+            await asyncio.shield(future)
+
+    async def _next_batch(self) -> Tuple[Batch, bool]:
+        """Collect items for one transaction; the flag says a stop was requested"""
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+
+        batch: Batch = [first]
+        count = len(first[0])
+        deadline = loop.time() + settings.chat_write_interval_ms / 1000
+        while count < settings.chat_write_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            count += len(item[0])
+        return batch, False
+
+    async def _write(self, batch: Batch):
+        rows = [row for item_rows, _ in batch for row in item_rows]
+        error = None
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(ChatMessage), rows)
+                await db.commit()
+            self.stats["written"] += len(rows)
+            self.stats["batches"] += 1
+        except Exception as e:
+            logger.exception("Failed to write %d chat messages", len(rows))
+            self.stats["failed"] += len(rows)
+            error = e
+
+        # Futures carry the error (or None) as their result: nobody has to retrieve it
+        for item_rows, future in batch:
+            if not future.done():
+                future.set_result(error)
+            for row in item_rows:
+                if self._last_by_user.get(row["user_id"]) is future:
+                    del self._last_by_user[row["user_id"]]
+
+    async def _run(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._write(batch)
+            if stopping:
+                # Drain whatever was queued behind the stop request
+                remaining = []
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        remaining.append(item)
+                if remaining:
+                    await self._write(remaining)
+                return
+
+chat_writer = ChatMessageWriter()
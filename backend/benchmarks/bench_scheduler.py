@@ -0,0 +1,76 @@
+"""Benchmark the study plan scheduler on large plans.
+
+Run from backend/:
+
+    python benchmarks/bench_scheduler.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import scheduler
+from app.schemas import SubjectSchema, TimeSlotSchema
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def make_plan(subject_count: int, slots_per_day: int, seed: int = 42):
+    rng = random.Random(seed)
+    subjects = [
+        SubjectSchema(
+            name=f"Subject {i}",
+            difficulty=rng.choice(["easy", "medium", "hard"]),
+            priority=rng.choice(["low", "medium", "high"]),
+            hours_per_week=rng.randint(1, 6)
+        )
+        for i in range(subject_count)
+    ]
+    time_slots = []
+    for day in DAYS:
+        for _ in range(slots_per_day):
+            start = rng.randint(6 * 60, 21 * 60)
+            end = min(start + rng.randint(30, 180), 24 * 60)
+            time_slots.append(TimeSlotSchema(
+                day=day,
+                start_time=f"{start // 60:02d}:{start % 60:02d}",
+                end_time=f"{end // 60:02d}:{end % 60:02d}",
+                is_available=True
+            ))
+    return subjects, time_slots
+
+def bench(label: str, fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"{label:<48} median {timings[len(timings) // 2]:8.2f} ms   best {timings[0]:8.2f} ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for subject_count, slots_per_day in [(10, 2), (100, 20), (500, 50), (1000, 100)]:
+        subjects, time_slots = make_plan(subject_count, slots_per_day)
+        label = f"{subject_count} subjects, {len(time_slots)} slots"
+        schedule = bench(
+            f"weekly schedule: {label}",
+            lambda: scheduler.build_weekly_schedule("pomodoro", subjects, time_slots),
+            args.repeat
+        )
+        rows = bench(
+            f"  expand 26 weeks ({len(schedule.blocks)} blocks/week)",
+            lambda: scheduler.expand_weeks(schedule, date(2025, 1, 6), 26, user_id=1, study_plan_id=1),
+            args.repeat
+        )
+        print(f"  -> {len(rows)} sessions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark list endpoint serialization: per-row from_orm + response_model
+re-validation (before) against column-only rows dumped by a TypeAdapter (after).
+
+Run from backend/:
+
+    python benchmarks/bench_serialization.py [--rows 100 1000] [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models import ChatMessage, StudySession, User
+from app.schemas import ChatMessageResponse, StudySessionResponse
+from app.serialization import list_serializer, model_columns
+
+def seed(engine, rows: int):
+    start = datetime(2025, 1, 6, 9)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"id": 1, "email": "bench@example.com", "username": "bench"}])
+        connection.execute(insert(StudySession), [
+            {
+                "user_id": 1,
+                "subject": f"Subject {i % 12}",
+                "start_time": start + timedelta(hours=i),
+                "end_time": start + timedelta(hours=i, minutes=50),
+                "duration": 50,
+                "session_type": "focus",
+                "completed": i % 3 == 0,
+                "notes": "Reviewed chapter notes and worked through problem sets. " * 4,
+                "created_at": start
+            }
+            for i in range(rows)
+        ])
+        connection.execute(insert(ChatMessage), [
+            {
+                "user_id": 1,
+                "content": "How should I plan my revision for next week? " * 6,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "timestamp": start + timedelta(minutes=i)
+            }
+            for i in range(rows)
+        ])
+
+def before(session: Session, model, schema) -> bytes:
+    """ORM entities, from_orm per row, then FastAPI's response_model pass"""
+    entities = session.scalars(select(model).where(model.user_id == 1)).all()
+    content = [schema.from_orm(entity) for entity in entities]
+    # serialize_response: validate against response_model, to JSON-able primitives, json.dumps
+    validated = TypeAdapter(List[schema]).validate_python(content, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+def after(session: Session, model, schema, serializer) -> bytes:
+    rows = session.execute(select(*model_columns(model, schema)).where(model.user_id == 1)).all()
+    return serializer.dump(rows)
+
+def bench(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+    # The "before" path deliberately uses the deprecated from_orm
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    for rows in args.rows:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        seed(engine, rows)
+        with Session(engine) as session:
+            for model, schema in [(StudySession, StudySessionResponse), (ChatMessage, ChatMessageResponse)]:
+                serializer = list_serializer(schema)
+                old_body = before(session, model, schema)
+                new_body = after(session, model, schema, serializer)
+                assert json.loads(old_body) == json.loads(new_body), "JSON contract changed"
+
+                old_ms = bench(lambda: before(session, model, schema), args.repeat)
+                new_ms = bench(lambda: after(session, model, schema, serializer), args.repeat)
+                print(
+                    f"{model.__tablename__:<16} {rows:>5} rows   before {old_ms:8.2f} ms   "
+                    f"after {new_ms:8.2f} ms   {old_ms / new_ms:5.1f}x"
+                )
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,27 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+import logging
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, study_plan, ai_chat, calendar
-from app.database import engine
+from app.routers import auth, study_plan, ai_chat, calendar, admin
+from app.database import engine, async_engine, get_sqlite_pragmas
 from app.models import Base
+from app.migrations import run_migrations
+from app.config import settings
+from app.ai_providers import close_ai_clients
+from app.response_cache import response_cache
+from app.password_hashing import password_hasher
+from app.pagination import NEXT_CURSOR_HEADER
+from app.write_behind import chat_writer
+from app.chat_retention import chat_retention
+from app import metrics
+from app.profiling import ProfilingMiddleware, PROFILE_ID_HEADER
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("lockin")
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(
     title="LoackIn API",
@@ -13,6 +29,14 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Time every statement on both engines, attributed to the current request
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+metrics.register_collectors()
+# Profiling runs inside the metrics middleware and shares its per-request SQL stats
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +44,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, PROFILE_ID_HEADER],
 )
 
 # Include routers
@@ -27,6 +52,27 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(study_plan.router, prefix="/api/study-plan", tags=["Study Plan"])
 app.include_router(ai_chat.router, prefix="/api/ai-chat", tags=["AI Chat"])
 app.include_router(calendar.router, prefix="/api/calendar", tags=["Calendar"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+
+@app.on_event("startup")
+async def startup():
+    # Report the SQLite profile actually in effect (WAL, synchronous, ...)
+    pragmas = get_sqlite_pragmas()
+    if pragmas:
+        logger.info("SQLite pragmas: %s", ", ".join(f"{name}={value}" for name, value in pragmas.items()))
+    chat_writer.start()
+    chat_retention.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Release pooled connections held by the AI provider clients
+    await close_ai_clients()
+    response_cache.close()
+    # Write queued chat messages before the engine goes away
+    await chat_writer.stop()
+    await chat_retention.stop()
+    await async_engine.dispose()
+    password_hasher.shutdown()
 
 @app.get("/")
 async def root():
@@ -36,6 +82,13 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "LoackIn API"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint():
+    """Metrics in the Prometheus text exposition format"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -47,9 +47,11 @@ def create_database():
     try:
         from app.database import engine
         from app.models import Base
+        from app.migrations import run_migrations
         
         print("Creating database tables...")
         Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
         print("✅ Database initialized successfully!")
         return True
         
@@ -0,0 +1,25 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database before it is imported
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.database import async_engine  # noqa: E402
+from main import app  # noqa: E402
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+    asyncio.run(async_engine.dispose())
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    client.post("/api/auth/register", json={"email": "test@example.com", "username": "test", "password": "password123"})
+    response = client.post("/api/auth/login", json={"email": "test@example.com", "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
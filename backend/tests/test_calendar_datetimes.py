@@ -0,0 +1,41 @@
+"""Offset-aware datetimes are stored as naive UTC for sessions and recurrences alike"""
+
+def test_session_and_recurrence_share_utc_convention(client, auth_headers):
+    response = client.post("/api/study-plan/sessions", json={
+        "subject": "Math", "start_time": "2030-02-04T10:00:00+02:00",
+        "end_time": "2030-02-04T11:00:00+02:00", "session_type": "focus"
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["start_time"] == "2030-02-04T08:00:00"
+
+    response = client.post("/api/study-plan/sessions/bulk", json={"sessions": [{
+        "subject": "Bio", "start_time": "2030-02-05T10:00:00+02:00",
+        "end_time": "2030-02-05T11:00:00+02:00", "session_type": "focus"
+    }]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()[0]["start_time"] == "2030-02-05T08:00:00"
+
+    response = client.post("/api/calendar/recurrences", json={
+        "subject": "Chem", "frequency": "daily", "start_time": "2030-02-04T10:00:00+02:00",
+        "duration": 60, "count": 2
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    rule_id = response.json()["id"]
+
+    week = client.get("/api/calendar/week?start_date=2030-02-04T00:00:00Z", headers=auth_headers).json()
+    monday = [(item["subject"], item["start_time"]) for item in week["2030-02-04"]]
+    assert sorted(monday) == [("Chem", "2030-02-04T08:00:00"), ("Math", "2030-02-04T08:00:00")]
+    tuesday = [(item["subject"], item["start_time"]) for item in week["2030-02-05"]]
+    assert sorted(tuesday) == [("Bio", "2030-02-05T08:00:00"), ("Chem", "2030-02-05T08:00:00")]
+
+    # The same instant, written with another offset, addresses the same occurrence
+    response = client.put(
+        f"/api/calendar/recurrences/{rule_id}/occurrences/2030-02-04T09:00:00%2B01:00",
+        json={"completed": True}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["start_time"] == "2030-02-04T08:00:00"
+
+def test_upcoming_limit_is_validated(client, auth_headers):
+    assert client.get("/api/calendar/upcoming?limit=-1", headers=auth_headers).status_code == 422
+    assert client.get("/api/calendar/upcoming?limit=1", headers=auth_headers).status_code == 200
@@ -163,7 +163,7 @@ const StudyModePage = () => {
     try {
       const context = { sessionCount, breakType: sessionCount + 1 >= 4 ? 'long' : 'short' }
       const prompt = `I just finished a focus session. Suggest a ${context.breakType === 'long' ? '10-15' : '5'} minute break with 2-3 specific rest tips and 1 light exercise I can do at my desk.`
-      const res = await apiService.chatWithAI(prompt, context)
+      const res = await apiService.chatWithAI(prompt, context, false)
       if (res.data?.response) {
         toast.success('Break recommendations ready!')
         localStorage.setItem('restTips', res.data.response)
@@ -218,13 +218,14 @@ class ApiService {
   }
 
   // AI Chat
-  async chatWithAI(message: string, context?: Record<string, any>) {
+  // history: false sends the message without the conversation so far (cacheable)
+  async chatWithAI(message: string, context?: Record<string, any>, history?: boolean) {
     return this.request<{
       response: string
       suggestions: string[]
     }>('/ai-chat/chat', {
       method: 'POST',
-      body: JSON.stringify({ message, context })
+      body: JSON.stringify({ message, context, history })
     })
   }
 